@@ -0,0 +1,107 @@
+import base64
+import sys
+from typing import Dict, Optional, Tuple
+import numpy as np
+
+
+class AnswerMatrix:
+    """Per-session arena of answer embeddings for "closest previous answer" lookups.
+
+    Every answer embedding of a session lives in one preallocated,
+    L2-normalized matrix (float32, or float16 to halve it) with parallel
+    question-index and compliance arrays; chat messages refer to their
+    embedding by row. Comparing a new answer against every stored one is a
+    single matrix-vector product plus a mask. The arena doubles in size if
+    it ever fills up.
+    """
+
+    def __init__(self, dimension: int, capacity: int = 64, dtype: str = "float32"):
+        if dtype not in ("float32", "float16"):
+            raise ValueError(f"Unsupported answer embedding dtype '{dtype}'; expected 'float32' or 'float16'")
+        capacity = max(1, capacity)
+        self.dimension = dimension
+        self._vectors = np.zeros((capacity, dimension), dtype=dtype)
+        self._question_indexes = np.full(capacity, -1, dtype=np.int32)
+        self._compliant = np.zeros(capacity, dtype=bool)
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    @staticmethod
+    def _normalize(vector) -> np.ndarray:
+        vector = np.asarray(vector, dtype=np.float32).reshape(-1)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def add(self, question_index: int, vector, compliant: bool = True) -> int:
+        """Store an answer embedding for `question_index` and return its row."""
+        if self._size == len(self._vectors):
+            self._vectors = np.concatenate([self._vectors, np.zeros_like(self._vectors)])
+            self._question_indexes = np.concatenate([self._question_indexes, np.full_like(self._question_indexes, -1)])
+            self._compliant = np.concatenate([self._compliant, np.zeros_like(self._compliant)])
+        row = self._size
+        self._vectors[row] = self._normalize(vector)
+        self._question_indexes[row] = question_index
+        self._compliant[row] = compliant
+        self._size += 1
+        return row
+
+    def closest(self, vector, exclude_question: int = None, compliant_only: bool = True) -> Optional[Tuple[int, float]]:
+        """Return (question index, cosine score) of the most similar stored answer, or None.
+
+        By default only compliant answers are considered. Answers to
+        `exclude_question` are ignored, e.g. to allow re-answering the
+        current question with similar wording.
+        """
+        if self._size == 0:
+            return None
+        scores = self._vectors[:self._size] @ self._normalize(vector).astype(self._vectors.dtype)
+        mask = np.ones(self._size, dtype=bool)
+        if compliant_only:
+            mask &= self._compliant[:self._size]
+        if exclude_question is not None:
+            mask &= self._question_indexes[:self._size] != exclude_question
+        if not mask.any():
+            return None
+        scores = np.where(mask, scores.astype(np.float32), -np.inf)
+        best = int(np.argmax(scores))
+        return int(self._question_indexes[best]), float(scores[best])
+
+    def to_dict(self) -> Dict:
+        """JSON-safe form holding only the used rows; vectors are base64 raw bytes."""
+        return {
+            "dimension": self.dimension,
+            "dtype": str(self._vectors.dtype),
+            "vectors": base64.b64encode(self._vectors[:self._size].tobytes()).decode("ascii"),
+            "question_indexes": self._question_indexes[:self._size].tolist(),
+            "compliant": self._compliant[:self._size].tolist(),
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict, capacity: int = 64) -> "AnswerMatrix":
+        size = len(data["question_indexes"])
+        matrix = cls(data["dimension"], capacity=max(capacity, size), dtype=data["dtype"])
+        vectors = np.frombuffer(base64.b64decode(data["vectors"]), dtype=data["dtype"])
+        matrix._vectors[:size] = vectors.reshape(size, data["dimension"])
+        matrix._question_indexes[:size] = data["question_indexes"]
+        matrix._compliant[:size] = data["compliant"]
+        matrix._size = size
+        return matrix
+
+    def nbytes(self) -> int:
+        return self._vectors.nbytes + self._question_indexes.nbytes + self._compliant.nbytes
+
+    def list_equivalent_bytes(self) -> int:
+        """What the same rows would cost stored as Python lists of floats (one list per answer)."""
+        per_row = sys.getsizeof([0.0] * self.dimension) + self.dimension * sys.getsizeof(0.0)
+        return self._size * per_row
+
+    def stats(self) -> Dict:
+        return {
+            "rows": self._size,
+            "capacity": len(self._vectors),
+            "dtype": str(self._vectors.dtype),
+            "bytes": self.nbytes(),
+            "list_equivalent_bytes": self.list_equivalent_bytes(),
+        }
@@ -1,27 +1,63 @@
 import os
-import sys
 import json
+import logging
 import random
-import unicodedata
+from contextlib import asynccontextmanager
 from typing import List, Dict, AsyncGenerator
-from sentence_transformers import SentenceTransformer
 import chromadb
 from langchain_chroma import Chroma
-from litellm import completion, APIConnectionError, RateLimitError
+import llm_gateway
+import pacing
+import policy_template
+from validation_cache import ValidationCache
+from semantic_cache import SemanticCache
+from embedding_service import EmbeddingService, EmbeddingBatcher, LangChainEmbeddings, load_embedding_model
+from memory_stats import process_memory
+from index_builder import (
+    CHUNKER_SETTINGS, IndexSnapshot, generic_entries, load_and_split_documents, load_snapshot,
+    policy_entries, question_bank, sync_collection,
+)
 from fastapi import FastAPI, HTTPException, UploadFile, File, Form
-from fastapi.responses import StreamingResponse, Response
+from fastapi.responses import JSONResponse, StreamingResponse, Response
 from pydantic import BaseModel
 import asyncio
 import numpy as np
 import settings
 import tempfile
-from policy_doc import generate_pdf
-from langchain.schema import Document as LangChainDocument
-from langchain_huggingface import HuggingFaceEmbeddings
+from render_pool import RenderPool, RenderQueueFull
+from answer_matrix import AnswerMatrix
+from checklist import Checklist, render_table
+from session_store import Session, SessionBusy, SessionStore, create_session_store
+from warmup import Warmup
 from langchain.prompts import PromptTemplate
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-
-app = FastAPI(title="NIST AI RMF Combined API")
+from langchain_core.retrievers import BaseRetriever
+from numpy_index import NumpyIndex, NumpyRetriever
+
+logging.basicConfig(level=settings.LOG_LEVEL, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+logger = logging.getLogger(__name__)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Warm up in the background so /health and /ready answer while models load;
+    # workers forked by serve.py inherit a finished warmup from the master
+    warmup_task = None if warmup.ready else asyncio.create_task(warmup.run())
+    sweeper_task = asyncio.create_task(sweep_sessions())
+    template_task = None
+    if settings.POLICY_TEMPLATE_RELOAD_INTERVAL_SECONDS > 0:
+        template_task = asyncio.create_task(policy_templates.watch(settings.POLICY_TEMPLATE_RELOAD_INTERVAL_SECONDS))
+    yield
+    if warmup_task is not None:
+        warmup_task.cancel()
+    sweeper_task.cancel()
+    if template_task is not None:
+        template_task.cancel()
+    if embedding_batcher is not None:
+        await embedding_batcher.close()
+    render_pool.shutdown()
+    await session_store.close()
+
+app = FastAPI(title="NIST AI RMF Combined API", lifespan=lifespan)
 from fastapi.middleware.cors import CORSMiddleware
 # litellm._turn_on_debug()
 
@@ -33,104 +69,15 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-class Document:
-    def __init__(self, page_content: str, metadata: Dict):
-        self.page_content = page_content
-        self.metadata = metadata
-
-def normalize_string(s):
-    return unicodedata.normalize('NFC', s)
-
-def load_and_split_documents(json_file: str) -> List[Document]:
-    try:
-        with open(json_file, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-    except Exception as e:
-        sys.exit(1)
-
-    documents = []
-    # Add LangChain text splitter for chunking
-    text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=2000,
-        chunk_overlap=250,
-        separators=["\n\n", "\n", " ", ""]
-    )
-
-    core_functions = data.get("NIST_AI_RMF_Overview", {}).get("5_How_Does_It_Address_and_Manage_Risks", {}).get("Core_Functions", {})
-    for section, content in core_functions.items():
-        sub_functions = content.get("Sub_Functions", {})
-        sub_points = [
-            {"id": key.replace("_", " "), "description": normalize_string(value)}
-            for key, value in sub_functions.items()
-        ]
-        content_text = f"{section}\n"
-        for sub_point in sub_points:
-            content_text += f"{sub_point['id']}: {sub_point['description']}\n"
-        # Split the content text into chunks
-        chunks = text_splitter.split_text(content_text)
-        for chunk in chunks:
-            documents.append(Document(
-                page_content=chunk,
-                metadata={"section": section}
-            ))
-
-    overview = data.get("NIST_AI_RMF_Overview", {})
-    for key, value in overview.items():
-        if key == "5_How_Does_It_Address_and_Manage_Risks":
-            continue
-        content_text = f"{key.replace('_', ' ')}\n"
-        def flatten_dict(d, parent_key=''):
-            items = []
-            for k, v in d.items():
-                new_key = f"{parent_key}_{k}" if parent_key else k
-                if isinstance(v, dict):
-                    items.extend(flatten_dict(v, new_key).items())
-                elif isinstance(v, list):
-                    items.append((new_key, ", ".join(v)))
-                else:
-                    items.append((new_key, v))
-            return dict(items)
-
-        flat_content = flatten_dict(value)
-        for k, v in flat_content.items():
-            content_text += f"{k.replace('_', ' ')}: {normalize_string(str(v))}\n"
-        # Split the content text into chunks
-        chunks = text_splitter.split_text(content_text)
-        for chunk in chunks:
-            documents.append(Document(
-                page_content=chunk,
-                metadata={"section": key.replace('_', ' ')}
-            ))
-
-    for key, value in data.items():
-        if key != "NIST_AI_RMF_Overview":
-            content_text = f"{key.replace('_', ' ')}\n"
-            flat_content = flatten_dict(value)
-            for k, v in flat_content.items():
-                content_text += f"{k.replace('_', ' ')}: {normalize_string(str(v))}\n"
-            # Split the content text into chunks
-            chunks = text_splitter.split_text(content_text)
-            for chunk in chunks:
-                documents.append(Document(
-                    page_content=chunk,
-                    metadata={"section": key.replace('_', ' ')}
-                ))
-
-    return documents
-
 def initialize_embeddings():
-    try:
-        embeddings = SentenceTransformer(settings.EMBEDDING_MODEL_NAME)
-        return embeddings
-    except Exception as e:
-        sys.exit(1)
-
-def setup_chroma_db(documents: List[Document], embedding_model) -> Chroma:
-    # Convert custom Document objects to LangChainDocument objects
-    langchain_docs = [LangChainDocument(page_content=doc.page_content, metadata=doc.metadata) for doc in documents]
-    
-    # Initialize embeddings for LangChain Chroma
-    embeddings = HuggingFaceEmbeddings(model_name=settings.EMBEDDING_MODEL_NAME)
+    # The only place the SentenceTransformer is loaded; everything else shares it
+    embeddings = load_embedding_model(settings.EMBEDDING_MODEL_NAME, settings.EMBEDDING_BACKEND, settings.EMBEDDING_ONNX_INT8_FILE)
+    logger.info("Loaded embedding model %s on %s backend (memory: %s)", settings.EMBEDDING_MODEL_NAME, settings.EMBEDDING_BACKEND, process_memory())
+    return embeddings
+
+def setup_chroma_db(embedder: EmbeddingService, snapshot: IndexSnapshot = None) -> Chroma:
+    # Chroma embeds through the shared model rather than loading its own copy
+    embeddings = LangChainEmbeddings(embedder, settings.EMBEDDING_BATCH_SIZE)
     
     # Create or load the Chroma vector store
     vector_store = Chroma(
@@ -139,23 +86,34 @@ def setup_chroma_db(documents: List[Document], embedding_model) -> Chroma:
         persist_directory=settings.CHROMA_DB_PATH
     )
 
-    # If the collection is empty, populate it with documents
-    if vector_store._collection.count() == 0:
-        vector_store = Chroma.from_documents(
-            documents=langchain_docs,
-            embedding=embeddings,
-            collection_name=settings.GENERIC_COLLECTION_NAME,
-            persist_directory=settings.CHROMA_DB_PATH
-        )
+    # Re-embed only the chunks that changed since the last build; with a
+    # snapshot the vectors are already computed and only need upserting
+    if snapshot is not None:
+        ids, texts, metadatas = snapshot.entries("generic")
+        vectors = snapshot.vectors("generic")
+    else:
+        ids, texts, metadatas = generic_entries(load_and_split_documents(settings.GENERIC_JSON_FILE))
+        vectors = None
+    sync_collection(vector_store._collection, ids, texts, metadatas, embedder, chunker=CHUNKER_SETTINGS, vectors=vectors)
 
     return vector_store
 
-def setup_rag_chain(vector_store) -> callable:
-    try:
-        # Define a prompt template for consistency with the system prompt
-        prompt_template = PromptTemplate(
-            input_variables=["context", "question"],
-            template=settings.GENERIC_SYSTEM_PROMPT + """
+def setup_retriever(vector_store: Chroma, embedder: EmbeddingService) -> BaseRetriever:
+    # Query embeddings come from the shared service (and its cache) either way
+    if settings.RETRIEVAL_BACKEND == "numpy":
+        index = NumpyIndex.from_collection(vector_store._collection)
+        logger.info("Serving generic retrieval from an in-memory index of %d chunks", len(index))
+        return NumpyRetriever(index=index, embedder=embedder, search_kwargs={"k": settings.RETRIEVAL_K})
+    if settings.RETRIEVAL_BACKEND == "chroma":
+        return vector_store.as_retriever(search_kwargs={"k": settings.RETRIEVAL_K})
+    raise ValueError(f"Unknown retrieval backend '{settings.RETRIEVAL_BACKEND}'; expected 'chroma' or 'numpy'")
+
+def setup_rag_chain(retriever: BaseRetriever) -> callable:
+    """Build the generic RAG chain: retrieve context for a question, then stream the answer."""
+    # Define a prompt template for consistency with the system prompt
+    prompt_template = PromptTemplate(
+        input_variables=["context", "question"],
+        template=settings.GENERIC_SYSTEM_PROMPT + """
 
 Context:
 {context}
@@ -164,191 +122,248 @@ Question: {question}
 
 Please provide your response in plain text format.
 """
-        )
+    )
 
-        def litellm_chain(question, context):
-            prompt = prompt_template.format(context=context, question=question)
-            try:
-                response = completion(
-                    model=settings.GENERIC_MODEL,
-                    messages=[{"role": "user", "content": prompt}],
-                    temperature=0,
-                    max_tokens=1024
-                )
-                return response.choices[0].message.content.strip()
-            except Exception as e:
-                raise
-
-        # Set up retriever from the vector store
-        retriever = vector_store.as_retriever(search_kwargs={"k": 4})
-
-        def rag_chain(question):
-            docs = retriever.get_relevant_documents(question)
-            context = "\n\n".join(doc.page_content for doc in docs)
-            return litellm_chain(question, context)
-
-        return rag_chain
-    except Exception as e:
-        sys.exit(1)
-
-# Rest of the existing functions (unchanged)
-def retrieve_documents(collection, query: str, embedding_model, k: int = 4) -> List[Dict]:
-    query_embedding = embedding_model.encode(query).tolist()
-    results = collection.query(query_embeddings=[query_embedding], n_results=k)
-    retrieved_docs = []
-    for i in range(len(results['ids'][0])):
-        retrieved_docs.append({
-            'page_content': results['documents'][0][i],
-            'metadata': results['metadatas'][0][i]
-        })
-    return retrieved_docs
-
-try:
-    with open(settings.POLICY_JSON_FILE, 'r', encoding='utf-8') as f:
-        knowledge_base = json.load(f)
-except UnicodeDecodeError as e:
-    sys.exit(1)
-
-questions = []
-for category, items in knowledge_base.items():
-    for item in items:
-        valid_answers = item.get("valid_answers", {})
-        valid_answer = random.choice([valid_answers.get("va1", ""), valid_answers.get("va2", "")]) if valid_answers else ""
-        questions.append({
-            "category": category,
-            "title": normalize_string(item["title"]),
-            "query": normalize_string(item["queries"]["q"]),
-            "citation": item["citation"],
-            "validator": item.get("validator", ""),
-            "valid_answer": valid_answer
-        })
-
-chat_histories: Dict[str, List[Dict]] = {}
-user_states: Dict[str, int] = {}
-conversation_states: Dict[str, str] = {}
-mode_states: Dict[str, str] = {}
-
-embedding_model = initialize_embeddings()
-
-client_policy = chromadb.PersistentClient(path=settings.CHROMA_DB_PATH)
-collection_policy = client_policy.get_or_create_collection(settings.POLICY_COLLECTION_NAME)
+    async def rag_chain_stream(question):
+        # Retrieval embeds the query on the CPU; keep it off the event loop
+        docs = await asyncio.to_thread(retriever.get_relevant_documents, question)
+        context = "\n\n".join(doc.page_content for doc in docs)
+        prompt = prompt_template.format(context=context, question=question)
+        async for token in llm_gateway.astream(
+            model=settings.GENERIC_MODEL,
+            messages=[{"role": "user", "content": prompt}],
+            temperature=0,
+            max_tokens=1024
+        ):
+            yield token
+
+    return rag_chain_stream
+
+# Filled in by the warmup stages below; /chat answers 503 until they have all run
+knowledge_base: Dict = {}
+questions: List[Dict] = []
+index_snapshot: IndexSnapshot = None
+embedding_model = None
+embedding_service: EmbeddingService = None
+embedding_batcher: EmbeddingBatcher = None
+vector_store: Chroma = None
+generic_retriever: BaseRetriever = None
+rag_chain_stream = None
+client_policy = None
+collection_policy = None
+
+def create_validation_cache() -> ValidationCache:
+    return ValidationCache(
+        max_entries=settings.VALIDATION_CACHE_MAX_ENTRIES,
+        ttl_seconds=settings.VALIDATION_CACHE_TTL_SECONDS,
+        backend=settings.VALIDATION_CACHE_BACKEND,
+        sqlite_path=settings.VALIDATION_CACHE_PATH,
+        enabled=settings.VALIDATION_CACHE_ENABLED,
+    )
 
-def populate_policy_chroma():
-    if collection_policy.count() == 0:
-        ids = []
-        documents = []
-        embeddings = []
-        metadatas = []
-        for category, items in knowledge_base.items():
-            for item in items:
-                query_text = item["queries"]["q"]
-                query_embedding = embedding_model.encode(query_text).tolist()
-                query_id = f"{category}_{item['title']}_query"
-                ids.append(query_id)
-                documents.append(query_text)
-                embeddings.append(query_embedding)
-                metadatas.append({"type": "query", "category": category, "title": item["title"]})
-                if item.get("validator"):
-                    validator_text = item["validator"]
-                    validator_embedding = embedding_model.encode(validator_text).tolist()
-                    validator_id = f"{category}_{item['title']}_validator"
-                    ids.append(validator_id)
-                    documents.append(validator_text)
-                    embeddings.append(validator_embedding)
-                    metadatas.append({"type": "validator", "category": category, "title": item["title"]})
-        collection_policy.add(
-            ids=ids,
-            documents=documents,
-            embeddings=embeddings,
-            metadatas=metadatas
-        )
+validation_cache = create_validation_cache()
 
-def cosine_similarity(vec1: list, vec2: list) -> float:
-    vec1 = np.array(vec1)
-    vec2 = np.array(vec2)
-    return np.dot(vec1, vec2) / (np.linalg.norm(vec1) * np.linalg.norm(vec2))
-
-def check_answer_similarity(user_id: str, current_index: int, user_embedding: list) -> str:
-    for msg in chat_histories[user_id]:
-        if (
-            msg["role"] == "user" 
-            and msg["question_index"] != current_index 
-            and "embedding" in msg 
-            and msg["compliance"] == "Compliant"
-        ):
-            similarity = cosine_similarity(user_embedding, msg["embedding"])
-            if similarity > 0.9:
-                return f"You have already provided a similar answer for '{questions[msg['question_index']]['title']}'. Please provide a different answer for this question."
+semantic_cache = SemanticCache(
+    threshold=settings.SEMANTIC_CACHE_THRESHOLD,
+    max_entries=settings.SEMANTIC_CACHE_MAX_ENTRIES,
+    watched_files=[settings.GENERIC_JSON_FILE],
+    fingerprint_extra=f"{settings.GENERIC_MODEL}\n{settings.GENERIC_SYSTEM_PROMPT}",
+    enabled=settings.SEMANTIC_CACHE_ENABLED,
+)
+
+render_pool = RenderPool(
+    max_workers=settings.RENDER_POOL_MAX_WORKERS,
+    max_queue=settings.RENDER_POOL_MAX_QUEUE,
+    retry_after=settings.RENDER_POOL_RETRY_AFTER_SECONDS,
+)
+
+def create_sessions() -> SessionStore:
+    return create_session_store(
+        settings.SESSION_BACKEND,
+        sqlite_path=settings.SESSION_SQLITE_PATH,
+        redis_url=settings.SESSION_REDIS_URL,
+        key_prefix=settings.SESSION_KEY_PREFIX,
+        lock_ttl=settings.SESSION_LOCK_TTL_SECONDS,
+        lock_timeout=settings.SESSION_LOCK_TIMEOUT_SECONDS,
+        memory_limits={
+            "idle_ttl": settings.SESSION_IDLE_TTL_SECONDS,
+            "max_resident": settings.SESSION_MAX_RESIDENT,
+            "max_resident_mb": settings.SESSION_MAX_RESIDENT_MB,
+            "spill_dir": settings.SESSION_SPILL_DIR,
+            "spill_ttl": settings.SESSION_SPILL_TTL_SECONDS,
+        },
+    )
+
+# All conversation state (mode, history, question index, policy answers) lives here
+session_store = create_sessions()
+
+# Parsed once at warmup, then swapped out whenever the template file changes
+policy_templates = policy_template.TemplateRegistry(settings.TEMPLATE_FILE)
+
+async def sweep_sessions():
+    while True:
+        await asyncio.sleep(settings.SESSION_SWEEP_INTERVAL_SECONDS)
+        try:
+            await session_store.sweep()
+        except Exception:
+            logger.exception("Session sweep failed")
+
+def populate_policy_chroma():
+    if index_snapshot is not None:
+        ids, documents, metadatas = index_snapshot.entries("policy")
+        vectors = index_snapshot.vectors("policy")
+    else:
+        ids, documents, metadatas = policy_entries(knowledge_base)
+        vectors = None
+    sync_collection(collection_policy, ids, documents, metadatas, embedding_service, vectors=vectors)
+
+def new_answer_matrix() -> AnswerMatrix:
+    # One row per question covers a full policy session without regrowing
+    return AnswerMatrix(embedding_service.dimension, capacity=len(questions), dtype=settings.SESSION_EMBEDDING_DTYPE)
+
+def check_answer_similarity(session: Session, current_index: int, user_embedding: np.ndarray) -> str:
+    # Compare against every earlier compliant answer to another question in one product
+    closest = session.answers.closest(user_embedding, exclude_question=current_index)
+    if closest is not None and closest[1] > 0.9:
+        return f"You have already provided a similar answer for '{questions[closest[0]]['title']}'. Please provide a different answer for this question."
     return None
 
-def generate_checklist(user_id: str) -> str:
+def checklist_rows(session: Session) -> List[Dict]:
+    return session.checklist.rows(questions)
+
+def generate_checklist(session: Session) -> str:
+    return session.checklist.markdown(questions)
+
+def build_policy_messages(session: Session, organization_name: str = None) -> List[Dict]:
+    template = policy_templates.current.text
+    checklist = generate_checklist(session)
+    if organization_name:
+        org_instruction = f"Use the organization name '{organization_name}'."
+    else:
+        org_instruction = "Leave the organization name as [Organization Name]."
+    prompt = f"Here is a policy template:\n\n{template}\n\nAnd here is the user's checklist with answers:\n\n{checklist}\n\nPlease generate a filled-in policy by integrating the user's answers into the template under the corresponding 'NIST AI RMF Sub-Categories' sections based on the 'Citation' column. Ensure that the 'Policy Details' is followed by 2 new lines, this section is always in markdown listed bullet points (within 3-5). {org_instruction} Do not hallucinate or add information not provided in the answers. Ensure the output is in Markdown format."
+    return [{"role": "user", "content": prompt}]
+
+async def generate_policy(session: Session, organization_name: str = None) -> str:
+    messages = build_policy_messages(session, organization_name)
     try:
-        last_answers = {}
-        non_compliant_answers = {}
-        for msg in chat_histories[user_id]:
-            if msg["role"] == "user":
-                question_index = msg["question_index"]
-                if msg["compliance"] == "Non-compliant":
-                    non_compliant_answers[question_index] = non_compliant_answers.get(question_index, []) + [msg]
-                else:
-                    last_answers[question_index] = msg
-        
-        checklist = []
-        for idx in range(len(questions)):
-            if idx in last_answers or idx in non_compliant_answers:
-                question = questions[idx]
-                answer_text = ""
-                compliance = "✅ Compliant"
-                comments = "Answer accepted as compliant."
-                
-                if idx in non_compliant_answers:
-                    for nc_answer in non_compliant_answers[idx]:
-                        answer_text += f"~~{nc_answer['content'].replace('|', ' ')}~~ "
-                
-                if idx in last_answers:
-                    answer_text += last_answers[idx]["content"].replace('|', ' ')
-                    if idx in non_compliant_answers:
-                        comments = "Initially non-compliant; corrected answer accepted."
-                
-                checklist.append({
-                    "Title": question["title"],
-                    "Citation": question["citation"],
-                    "Query": question["query"],
-                    "Answer": answer_text,
-                    "Compliance": compliance,
-                    "Comments": comments
-                })
-        
-        table = "| Title | Citation | Query | Answer | Compliance | Comments |\n"
-        table += "|-------|----------|-------|--------|------------|----------|\n"
-        for item in checklist:
-            table += f"| {item['Title'].replace('|', ' ')} | {item['Citation']} | {item['Query'].replace('|', ' ')} | {item['Answer']} | {item['Compliance']} | {item['Comments'].replace('|', ' ')} |\n"
-        return table
+        policy = await llm_gateway.acomplete_text(model=settings.POLICY_GENERATOR_MODEL, messages=messages)
+        return policy
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to generate checklist: {str(e)}")
+        return f"**Error generating policy**: {str(e)}"
+
+async def generate_policy_stream(session: Session, organization_name: str = None) -> AsyncGenerator[str, None]:
+    """Stream the policy, flushing at every '## ' section heading.
 
-def load_template(filename: str) -> str:
+    Busy provider errors propagate so the caller can send the usual reply;
+    any other failure is reported inline like generate_policy does.
+    """
+    messages = build_policy_messages(session, organization_name)
+    tokens = llm_gateway.astream(model=settings.POLICY_GENERATOR_MODEL, messages=messages)
     try:
-        with open(filename, 'r', encoding='utf-8') as f:
-            return f.read()
+        async for chunk in pacing.flush_on_boundary(tokens, "\n## ", settings.POLICY_FLUSH_INTERVAL_MS):
+            yield chunk
+    except llm_gateway.BUSY_ERRORS:
+        raise
     except Exception as e:
-        return "Template not found."
+        yield f"\n\n**Error generating policy**: {str(e)}"
 
-def generate_policy(user_id: str, organization_name: str = None) -> str:
-    template = load_template(settings.TEMPLATE_FILE)
-    checklist = generate_checklist(user_id)
+async def generate_policy_section(section: Dict, rows: List[Dict], organization_name: str = None) -> str:
+    """Fill in one template section from the checklist rows that cite it."""
     if organization_name:
         org_instruction = f"Use the organization name '{organization_name}'."
     else:
         org_instruction = "Leave the organization name as [Organization Name]."
-    prompt = f"Here is a policy template:\n\n{template}\n\nAnd here is the user's checklist with answers:\n\n{checklist}\n\nPlease generate a filled-in policy by integrating the user's answers into the template under the corresponding 'NIST AI RMF Sub-Categories' sections based on the 'Citation' column. Ensure that the 'Policy Details' is followed by 2 new lines, this section is always in markdown listed bullet points (within 3-5). {org_instruction} Do not hallucinate or add information not provided in the answers. Ensure the output is in Markdown format."
+    prompt = f"Here is one section of a policy template:\n\n{section['text']}\n\nAnd here are the user's checklist answers for this section:\n\n{render_table(rows)}\n\nPlease fill in this section by integrating the user's answers. Keep the heading line '{section['heading']}' and the 'NIST AI RMF Sub-Categories' line unchanged. Ensure that the 'Policy Details' is followed by 2 new lines, this section is always in markdown listed bullet points (within 3-5). {org_instruction} Do not hallucinate or add information not provided in the answers. Return only this section in Markdown format."
     messages = [{"role": "user", "content": prompt}]
     try:
-        response = completion(model=settings.POLICY_GENERATOR_MODEL, messages=messages)
-        policy = response["choices"][0]["message"]["content"]
-        return policy
+        text = await llm_gateway.acomplete_text(model=settings.POLICY_GENERATOR_MODEL, messages=messages)
+    except llm_gateway.BUSY_ERRORS:
+        raise
     except Exception as e:
-        return f"**Error generating policy**: {str(e)}"
+        return f"{section['heading']}\n\n**Error generating policy**: {str(e)}"
+    # Drop any preamble the model adds before the heading, and restore a missing heading
+    start = text.find(section["heading"])
+    return text[start:] if start >= 0 else f"{section['heading']}\n\n{text.strip()}"
+
+async def generate_policy_parallel(session: Session, organization_name: str = None) -> AsyncGenerator[str, None]:
+    """Generate every answered template section concurrently and stream them in template order.
+
+    Sections no checklist row cites (introduction, conclusion, unanswered
+    questions) are copied from the template without an LLM call.
+    """
+    # One template version for the whole policy, even if a reload lands mid-stream
+    template = policy_templates.current
+    # Cap this request's share of the policy model's gateway slots; sections
+    # start in template order as slots free up, so the stream is not held up
+    # by sections further down
+    slots = asyncio.Semaphore(settings.POLICY_MAX_PARALLEL_SECTIONS)
+
+    async def generate_section(section: Dict, section_rows: List[Dict]) -> str:
+        async with slots:
+            return await generate_policy_section(section, section_rows, organization_name)
+
+    pending = []
+    for section, section_rows in zip(template.sections, template.rows_by_section(checklist_rows(session))):
+        if section_rows:
+            pending.append(asyncio.create_task(generate_section(section, section_rows)))
+        else:
+            pending.append(policy_template.fill_organization(section["text"], organization_name))
+    try:
+        yield policy_template.fill_organization(template.preamble, organization_name)
+        for i, part in enumerate(pending):
+            text = await part if isinstance(part, asyncio.Task) else part
+            # The template has no rule between the preamble and the first section
+            yield ("\n\n" if i == 0 else policy_template.SECTION_SEPARATOR) + text.strip()
+    finally:
+        for part in pending:
+            if isinstance(part, asyncio.Task):
+                part.cancel()
+
+async def record_reply(user_id: str, content: str, finish_conversation: bool = False):
+    """Append a reply that finished streaming after its request's session update was saved."""
+    async with session_store.session(user_id) as session:
+        session.add_message("assistant", content)
+        if finish_conversation:
+            session.conversation_state = None
+
+async def policy_response(session: Session, organization_name: str = None) -> StreamingResponse:
+    """Generate the policy for a finished questionnaire and record it in history."""
+    header = "**Here is your generated policy**:\n\n"
+    if settings.POLICY_GENERATION_MODE == "blocking":
+        policy = await generate_policy(session, organization_name)
+        response_text = f"{header}{policy}"
+        session.add_message("assistant", response_text)
+        session.conversation_state = None
+        return StreamingResponse(non_streamed_response(response_text), media_type="text/plain; charset=utf-8")
+
+    if settings.POLICY_GENERATION_MODE == "parallel":
+        chunks = generate_policy_parallel(session, organization_name)
+    else:
+        chunks = generate_policy_stream(session, organization_name)
+    user_id = session.user_id
+    # Wait for the first chunk so busy errors still reach the caller's handler
+    first_chunk = await anext(chunks, "")
+
+    async def stream_policy():
+        parts = [first_chunk]
+        busy = False
+        try:
+            yield header + first_chunk
+            async for chunk in chunks:
+                parts.append(chunk)
+                yield chunk
+        except llm_gateway.BUSY_ERRORS:
+            busy = True
+            parts.append("\n\nOur Servers are busy right now, try again later.")
+            yield parts[-1]
+        finally:
+            await chunks.aclose()
+            # Keep the state on a busy error so the user can retry the same step
+            await asyncio.shield(record_reply(user_id, header + "".join(parts), finish_conversation=not busy))
+        yield "\n"
+
+    return StreamingResponse(pacing.track_connection(stream_policy(), "policy_stream"), media_type="text/plain; charset=utf-8")
 
 async def validate_answer(user_answer: str, question_index: int) -> Dict:
     validator = questions[question_index]["validator"]
@@ -361,18 +376,24 @@ async def validate_answer(user_answer: str, question_index: int) -> Dict:
             "message": "Answer lacks detail. Describe AI accountability, roles, training, and reporting mechanisms across leadership and developers."
         }
     
+    cache_key = ValidationCache.make_key(question_index, validator, user_answer, settings.VALIDATOR_AGENT_MODEL, settings.VALIDATOR_SYSTEM_PROMPT)
+    cached = await validation_cache.get(cache_key)
+    if cached:
+        return cached
+
     messages = [
         {"role": "system", "content": settings.VALIDATOR_SYSTEM_PROMPT},
         {"role": "user", "content": f"Validator criteria: {validator}\n\nUser answer: {user_answer}\n\nEvaluate and return a JSON object with 'compliance' and 'message' fields."}
     ]
     
     try:
-        response = completion(model=settings.VALIDATOR_AGENT_MODEL, messages=messages)
-        content = response["choices"][0]["message"]["content"]
+        content = await llm_gateway.acomplete_text(model=settings.VALIDATOR_AGENT_MODEL, messages=messages)
         try:
             validation_result = json.loads(content)
             compliance = validation_result.get("compliance", "Non-compliant")
             message = validation_result.get("message", "Invalid validator response format.")
+            # Only genuine verdicts are cached; fallbacks below are retried next time
+            await validation_cache.set(cache_key, {"compliance": compliance, "message": message})
             return {"compliance": compliance, "message": message}
         except json.JSONDecodeError as e:
             return {
@@ -385,240 +406,375 @@ async def validate_answer(user_answer: str, question_index: int) -> Dict:
             "message": f"Validation error. Provide detailed answer on AI accountability, roles, training, and reporting."
         }
 
-async def stream_response(response_text: str, valid_answer: str = None) -> AsyncGenerator[str, None]:
-    words = response_text.split()
-    for word in words:
-        yield word + " "
-        await asyncio.sleep(0.05)
+def valid_answer_trailer(valid_answer: str = None) -> str:
     if valid_answer:
-        yield f"\n[VALID_ANSWER]{valid_answer}[/VALID_ANSWER]\n"
-    else:
-        yield "\n"
+        return f"\n[VALID_ANSWER]{valid_answer}[/VALID_ANSWER]\n"
+    return "\n"
+
+async def stream_response(response_text: str, valid_answer: str = None) -> AsyncGenerator[str, None]:
+    async for chunk in pacing.paced_stream(response_text, valid_answer_trailer(valid_answer)):
+        yield chunk
 
 async def non_streamed_response(response_text: str, valid_answer: str = None) -> AsyncGenerator[str, None]:
-    yield response_text
-    if valid_answer:
-        yield f"\n[VALID_ANSWER]{valid_answer}[/VALID_ANSWER]\n"
-    else:
-        yield "\n"
+    async for chunk in pacing.paced_stream(response_text, valid_answer_trailer(valid_answer), mode="instant"):
+        yield chunk
 
 class ChatRequest(BaseModel):
     content: str
 
-try:
-    documents = load_and_split_documents(settings.GENERIC_JSON_FILE)
-    vector_store = setup_chroma_db(documents, embedding_model)
-    rag_chain = setup_rag_chain(vector_store)
+def load_policy_template():
+    # Raises if the template is missing, failing warmup instead of generating policies without it
+    policy_templates.load()
+
+def load_knowledge_base():
+    global knowledge_base, index_snapshot, questions
+    with open(settings.POLICY_JSON_FILE, 'r', encoding='utf-8') as f:
+        knowledge_base = json.load(f)
+    # Prebuilt by `python -m build_index`; None (and a startup re-embed) if missing or stale
+    index_snapshot = load_snapshot(settings.INDEX_SNAPSHOT_PATH)
+    bank = index_snapshot.questions if index_snapshot is not None else question_bank(knowledge_base)
+    loaded = []
+    for entry in bank:
+        question = {key: value for key, value in entry.items() if key != "valid_answers"}
+        question["valid_answer"] = random.choice(entry["valid_answers"]) if entry["valid_answers"] else ""
+        loaded.append(question)
+    questions = loaded
+
+def load_embeddings():
+    global embedding_model, embedding_service, embedding_batcher
+    embedding_model = initialize_embeddings()
+    embedding_service = EmbeddingService(embedding_model, cache_size=settings.EMBEDDING_CACHE_SIZE)
+    embedding_batcher = EmbeddingBatcher(
+        embedding_service,
+        max_batch=settings.EMBEDDING_MICRO_BATCH_MAX_SIZE,
+        max_wait_ms=settings.EMBEDDING_MICRO_BATCH_MAX_WAIT_MS,
+    )
+
+def sync_generic_collection():
+    global vector_store
+    vector_store = setup_chroma_db(embedding_service, index_snapshot)
+
+def sync_policy_collection():
+    global client_policy, collection_policy
+    client_policy = chromadb.PersistentClient(path=settings.CHROMA_DB_PATH)
+    collection_policy = client_policy.get_or_create_collection(settings.POLICY_COLLECTION_NAME)
     populate_policy_chroma()
-except Exception as e:
-    sys.exit(1)
-    
+
+def build_rag_chains():
+    global generic_retriever, rag_chain_stream
+    generic_retriever = setup_retriever(vector_store, embedding_service)
+    rag_chain_stream = setup_rag_chain(generic_retriever)
+
+def warm_model():
+    # First inference allocates buffers and faults in the weights; pay for it here
+    embedding_service.encode_corpus([questions[0]["query"], "What is the NIST AI RMF?"], 2, label="warmup")
+
+def warm_retrieval():
+    # Touch both collections once so their indexes are loaded before real traffic
+    generic_retriever.invoke("What is the NIST AI RMF?")
+    collection_policy.query(query_embeddings=[embedding_service.encode(questions[0]["query"]).tolist()], n_results=1)
+
+warmup = Warmup([
+    ("policy_template", load_policy_template),
+    ("knowledge_base", load_knowledge_base),
+    ("embedding_model", load_embeddings),
+    ("generic_collection", sync_generic_collection),
+    ("policy_collection", sync_policy_collection),
+    ("rag_chain", build_rag_chains),
+    ("warm_model", warm_model),
+    ("warm_retrieval", warm_retrieval),
+])
+
+def close_vector_stores():
+    """Close every Chroma handle and its SQLite connections.
+
+    serve.py calls this in the master after warmup: forked workers serve
+    retrieval from the in-memory index and never touch Chroma.
+    """
+    global vector_store, client_policy, collection_policy
+    if client_policy is not None:
+        client_policy._system.stop()
+        client_policy.clear_system_cache()
+    vector_store = client_policy = collection_policy = None
+
+def ensure_ready():
+    if not warmup.ready:
+        raise HTTPException(
+            status_code=503,
+            detail="Service is still starting up." if warmup.state == "starting" else "Service failed to start.",
+            headers={"Retry-After": "5"},
+        )
+
 @app.get("/health")
 async def health_check():
+    # Liveness: the process is up; only a failed warmup makes it unhealthy
+    if warmup.state == "failed":
+        return JSONResponse(status_code=503, content={"status": "Matra Bot failed to start", "warmup": warmup.status()})
     return {"status": "Matra Bot Running!"}
 
+@app.get("/ready")
+async def ready_check():
+    # Readiness: only route traffic here once models and indexes are hot
+    if not warmup.ready:
+        return JSONResponse(status_code=503, content=warmup.status())
+    return warmup.status()
+
+@app.get("/metrics")
+async def metrics():
+    embeddings = dict(embedding_service.stats(), micro_batching=embedding_batcher.stats()) if warmup.ready else {}
+    return {
+        "warmup": warmup.status(),
+        "connections": pacing.connection_stats.snapshot(),
+        "llm": llm_gateway.gateway_stats(),
+        "validation_cache": validation_cache.stats(),
+        "semantic_cache": semantic_cache.stats(),
+        "embeddings": embeddings,
+        "memory": dict(process_memory(), pid=os.getpid()),
+        "sessions": session_store.stats(),
+        "render_pool": render_pool.stats(),
+        "policy_template": policy_templates.stats(),
+    }
+
+@app.get("/checklist/{user_id}")
+async def get_checklist(user_id: str, format: str = "json"):
+    """The user's policy checklist so far, as JSON rows or the markdown table."""
+    ensure_ready()
+    if format not in ("json", "markdown"):
+        raise HTTPException(status_code=400, detail="format must be 'json' or 'markdown'")
+    session = await session_store.get(user_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="No session found for this user.")
+    if format == "markdown":
+        return Response(generate_checklist(session), media_type="text/markdown; charset=utf-8")
+    return {"user_id": user_id, "answered": len(session.checklist), "total": len(questions), "rows": checklist_rows(session)}
+
+@app.get("/history/{user_id}")
+async def get_history(user_id: str):
+    """The user's chat history, with long replies read back from the payload store."""
+    ensure_ready()
+    session = await session_store.get(user_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="No session found for this user.")
+    messages = []
+    for message in session.history:
+        entry = {"role": message.role, "content": session.text(message)}
+        if message.question_index is not None:
+            entry["title"] = questions[message.question_index]["title"] if message.question_index < len(questions) else None
+            entry["compliant"] = message.compliant
+        messages.append(entry)
+    return {"user_id": user_id, "mode": session.mode, "messages": messages}
+
 @app.post("/chat/{user_id}")
 async def chat(user_id: str, request: ChatRequest):
+    ensure_ready()
+    try:
+        # The whole turn is one atomic update of the user's session
+        async with session_store.session(user_id) as session:
+            return await chat_turn(session, request)
+    except SessionBusy:
+        raise HTTPException(status_code=409, detail="Another message for this session is still being processed.", headers={"Retry-After": "2"})
+
+async def chat_turn(session: Session, request: ChatRequest):
+    user_id = session.user_id
     try:
         user_input = request.content.strip().lower()
 
-        # Initialize user if they don't exist yet
-        if user_id not in chat_histories:
-            chat_histories[user_id] = []
-            mode_states[user_id] = "generic"
-
         # Handle switching to policy mode
-        if user_input == "build policy" and mode_states.get(user_id, "generic") == "generic":
-            mode_states[user_id] = "policy"
-            chat_histories[user_id] = [{"role": "assistant", "content": questions[0]["query"]}]
-            user_states[user_id] = 0
-            conversation_states.pop(user_id, None)
+        if user_input == "build policy" and session.mode == "generic":
+            session.mode = "policy"
+            session.clear_history()
+            session.add_message("assistant", questions[0]["query"])
+            session.question_index = 0
+            session.answers = new_answer_matrix()
+            session.checklist = Checklist()
+            session.conversation_state = None
             response_text = f"**Policy Builder Mode**: Type 'exit' to return to general Q&A.\n\n**Question**: {questions[0]['query']}"
             valid_answer = questions[0]["valid_answer"]
-            chat_histories[user_id].append({"role": "assistant", "content": response_text})
+            session.add_message("assistant", response_text)
             return StreamingResponse(stream_response(response_text, valid_answer), media_type="text/plain; charset=utf-8")
         
         # Handle exiting policy mode
-        if user_input == "exit" and mode_states.get(user_id, "generic") == "policy":
-            mode_states[user_id] = "generic"
+        if user_input == "exit" and session.mode == "policy":
+            session.mode = "generic"
             response_text = "Returned to general Q&A mode. Ask any NIST AI RMF-related question."
-            chat_histories[user_id].append({"role": "user", "content": "exit"})
-            chat_histories[user_id].append({"role": "assistant", "content": response_text})
-            chat_histories[user_id] = [msg for msg in chat_histories[user_id] if msg["role"] != "user" or msg["content"].lower() != "exit"]
+            session.add_message("assistant", response_text)
             return StreamingResponse(stream_response(response_text), media_type="text/plain; charset=utf-8")
 
         # Handle policy mode
-        if mode_states.get(user_id, "generic") == "policy":
-            if user_id in conversation_states:
-                state = conversation_states[user_id]
+        if session.mode == "policy":
+            if session.conversation_state is not None:
+                state = session.conversation_state
                 if state == "awaiting_policy_decision":
                     if user_input == "yes":
-                        conversation_states[user_id] = "awaiting_organization_decision"
+                        session.conversation_state = "awaiting_organization_decision"
                         response_text = "Do you want to provide your organization name? (Yes/No)"
-                        chat_histories[user_id].append({"role": "assistant", "content": response_text})
+                        session.add_message("assistant", response_text)
                         return StreamingResponse(stream_response(response_text), media_type="text/plain; charset=utf-8")
                     elif user_input == "no":
                         response_text = "Thank you for using the NIST AI RMF Policy Builder."
-                        chat_histories[user_id].append({"role": "assistant", "content": response_text})
-                        del conversation_states[user_id]
+                        session.add_message("assistant", response_text)
+                        session.conversation_state = None
                         return StreamingResponse(stream_response(response_text), media_type="text/plain; charset=utf-8")
                     else:
                         response_text = "Please respond with 'Yes' or 'No'."
                         return StreamingResponse(stream_response(response_text), media_type="text/plain; charset=utf-8")
                 elif state == "awaiting_organization_decision":
                     if user_input == "yes":
-                        conversation_states[user_id] = "awaiting_organization_name"
+                        session.conversation_state = "awaiting_organization_name"
                         response_text = "Please provide your organization name."
-                        chat_histories[user_id].append({"role": "assistant", "content": response_text})
+                        session.add_message("assistant", response_text)
                         return StreamingResponse(stream_response(response_text), media_type="text/plain; charset=utf-8")
                     elif user_input == "no":
-                        # BEGIN EDIT: Handle (APIConnectionError, RateLimitError) for policy generation
+                        # BEGIN EDIT: Handle busy LLM errors for policy generation
                         try:
-                            policy = generate_policy(user_id)
-                            response_text = f"**Here is your generated policy**:\n\n{policy}"
-                            chat_histories[user_id].append({"role": "assistant", "content": response_text})
-                            del conversation_states[user_id]
-                            return StreamingResponse(non_streamed_response(response_text), media_type="text/plain; charset=utf-8")
-                        except (APIConnectionError, RateLimitError):
+                            return await policy_response(session)
+                        except llm_gateway.BUSY_ERRORS:
                             response_text = "Our Servers are busy right now, try again later."
-                            chat_histories[user_id].append({"role": "assistant", "content": response_text})
+                            session.add_message("assistant", response_text)
                             return StreamingResponse(stream_response(response_text), media_type="text/plain; charset=utf-8")
                         # END EDIT
                     else:
                         response_text = "Please respond with 'Yes' or 'No'."
                         return StreamingResponse(stream_response(response_text), media_type="text/plain; charset=utf-8")
                 elif state == "awaiting_organization_name":
-                    # BEGIN EDIT: Handle (APIConnectionError, RateLimitError) for policy generation with organization name
+                    # BEGIN EDIT: Handle busy LLM errors for policy generation with organization name
                     try:
                         organization_name = request.content.strip()
-                        policy = generate_policy(user_id, organization_name)
-                        response_text = f"**Here is your generated policy**:\n\n{policy}"
-                        chat_histories[user_id].append({"role": "assistant", "content": response_text})
-                        del conversation_states[user_id]
-                        return StreamingResponse(non_streamed_response(response_text), media_type="text/plain; charset=utf-8")
-                    except (APIConnectionError, RateLimitError):
+                        return await policy_response(session, organization_name)
+                    except llm_gateway.BUSY_ERRORS:
                         response_text = "Our Servers are busy right now, try again later."
-                        chat_histories[user_id].append({"role": "assistant", "content": response_text})
+                        session.add_message("assistant", response_text)
                         return StreamingResponse(stream_response(response_text), media_type="text/plain; charset=utf-8")
                     # END EDIT
 
-            current_index = user_states[user_id]
+            current_index = session.question_index
             user_answer = request.content.strip()
 
             if not user_answer or len(user_answer) < 10:
-                # BEGIN EDIT: Handle (APIConnectionError, RateLimitError) for answer validation
+                # BEGIN EDIT: Handle busy LLM errors for answer validation
                 try:
                     messages = [
                         {"role": "system", "content": settings.POLICY_SYSTEM_PROMPT},
                         {"role": "user", "content": f"Is this user answer meaningful: '{user_answer}'? If not, suggest a response to prompt for a better answer."}
                     ]
-                    response = completion(model=settings.QUERY_AGENT_MODEL, messages=messages)
-                    suggested_response = response["choices"][0]["message"]["content"]
+                    suggested_response = await llm_gateway.acomplete_text(model=settings.QUERY_AGENT_MODEL, messages=messages)
                     if "not meaningful" in suggested_response.lower():
-                        chat_histories[user_id].append({"role": "assistant", "content": suggested_response})
+                        session.add_message("assistant", suggested_response)
                         response_text = f"**Error**: {suggested_response}\n\n**Question**: {questions[current_index]['query']}"
                         valid_answer = questions[current_index]["valid_answer"]
                         return StreamingResponse(stream_response(response_text, valid_answer), media_type="text/plain; charset=utf-8")
-                except (APIConnectionError, RateLimitError):
+                except llm_gateway.BUSY_ERRORS:
                     response_text = "Our Servers are busy right now, try again later."
-                    chat_histories[user_id].append({"role": "assistant", "content": response_text})
+                    session.add_message("assistant", response_text)
                     return StreamingResponse(stream_response(response_text), media_type="text/plain; charset=utf-8")
                 # END EDIT
                 response_text = f"**Error**: Please provide a meaningful answer with sufficient detail.\n\n**Question**: {questions[current_index]['query']}"
                 valid_answer = questions[current_index]["valid_answer"]
                 return StreamingResponse(stream_response(response_text, valid_answer), media_type="text/plain; charset=utf-8")
 
-            user_embedding = embedding_model.encode(user_answer).tolist()
-            similarity_message = check_answer_similarity(user_id, current_index, user_embedding)
-            category = questions[current_index]["category"]
-            title = questions[current_index]["title"]
+            user_vector = await embedding_batcher.encode(user_answer)
+            similarity_message = check_answer_similarity(session, current_index, user_vector)
 
             if similarity_message:
                 response_text = f"**Non-compliant**: {similarity_message}\n\n**Question**: {questions[current_index]['query']}"
                 valid_answer = questions[current_index]["valid_answer"]
                 return StreamingResponse(stream_response(response_text, valid_answer), media_type="text/plain; charset=utf-8")
 
-            # BEGIN EDIT: Handle (APIConnectionError, RateLimitError) for answer validation
+            # BEGIN EDIT: Handle busy LLM errors for answer validation
             try:
                 validation_result = await validate_answer(user_answer, current_index)
-            except (APIConnectionError, RateLimitError):
+            except llm_gateway.BUSY_ERRORS:
                 response_text = "Our Servers are busy right now, try again later."
-                chat_histories[user_id].append({"role": "assistant", "content": response_text})
+                session.add_message("assistant", response_text)
                 return StreamingResponse(stream_response(response_text), media_type="text/plain; charset=utf-8")
             # END EDIT
 
             if validation_result["compliance"] == "Non-compliant":
-                chat_histories[user_id].append({
-                    "role": "user",
-                    "content": user_answer,
-                    "compliance": "Non-compliant",
-                    "category": category,
-                    "title": title,
-                    "question_index": current_index,
-                    "embedding": user_embedding
-                })
+                embedding_row = session.answers.add(current_index, user_vector, compliant=False)
+                session.checklist.record(current_index, user_answer, compliant=False)
+                session.add_message("user", user_answer, question_index=current_index, compliant=False, embedding_row=embedding_row)
                 response_text = f"**Your answer is non-compliant**.\n{validation_result['message']}\n\n**Question**: {questions[current_index]['query']}"
                 valid_answer = questions[current_index]["valid_answer"]
-                chat_histories[user_id].append({"role": "assistant", "content": response_text})
+                session.add_message("assistant", response_text)
                 return StreamingResponse(stream_response(response_text, valid_answer), media_type="text/plain; charset=utf-8")
             else:
-                chat_histories[user_id].append({
-                    "role": "user",
-                    "content": user_answer,
-                    "compliance": "Compliant",
-                    "category": category,
-                    "title": title,
-                    "question_index": current_index,
-                    "embedding": user_embedding
-                })
-                user_states[user_id] += 1
-                if user_states[user_id] < len(questions):
-                    next_question = questions[user_states[user_id]]["query"]
-                    chat_histories[user_id].append({"role": "assistant", "content": next_question})
+                embedding_row = session.answers.add(current_index, user_vector, compliant=True)
+                session.checklist.record(current_index, user_answer, compliant=True)
+                session.add_message("user", user_answer, question_index=current_index, compliant=True, embedding_row=embedding_row)
+                session.question_index += 1
+                if session.question_index < len(questions):
+                    next_question = questions[session.question_index]["query"]
+                    session.add_message("assistant", next_question)
                     response_text = f"**Question**: {next_question}"
-                    valid_answer = questions[user_states[user_id]]["valid_answer"]
+                    valid_answer = questions[session.question_index]["valid_answer"]
                     return StreamingResponse(stream_response(response_text, valid_answer), media_type="text/plain; charset=utf-8")
                 else:
-                    checklist = generate_checklist(user_id)
+                    checklist = generate_checklist(session)
                     response_text = f"**All questions answered. Here's your checklist**:\n\n{checklist}\n\nWould you like to generate a policy based on your answers? (Yes/No)"
-                    conversation_states[user_id] = "awaiting_policy_decision"
-                    chat_histories[user_id].append({"role": "assistant", "content": response_text})
+                    session.conversation_state = "awaiting_policy_decision"
+                    session.add_message("assistant", response_text)
                     return StreamingResponse(non_streamed_response(response_text), media_type="text/plain; charset=utf-8")
 
         # Handle generic mode - optimized to avoid duplicate processing
         else:
-            chat_histories[user_id].append({"role": "user", "content": request.content})
-            
-            # BEGIN EDIT: Handle (APIConnectionError, RateLimitError) for RAG chain
+            session.add_message("user", request.content)
+            session.trim_generic_turns(settings.SESSION_MAX_GENERIC_TURNS)
+            policy_prompt = "\n\nWould you like to build a policy now? (Type 'build policy' to start)"
+
+            # Paraphrases of an already answered question skip retrieval and the LLM
+            question_embedding = None
+            if semantic_cache.enabled:
+                question_embedding = await embedding_batcher.encode(request.content)
+                cached_answer = semantic_cache.lookup(question_embedding)
+                if cached_answer is not None:
+                    full_response = cached_answer + policy_prompt
+                    session.add_message("assistant", full_response)
+                    return StreamingResponse(stream_response(full_response), media_type="text/markdown")
+
+            # BEGIN EDIT: Handle busy LLM errors for RAG chain
+            tokens = rag_chain_stream(request.content)
             try:
-                response = rag_chain(request.content)
-                full_response = response + "\n\nWould you like to build a policy now? (Type 'build policy' to start)"
-                
-                # Store in history
-                chat_histories[user_id].append({"role": "assistant", "content": full_response})
-                
-                # Stream the response
-                async def stream_generic_response():
-                    words = full_response.split()
-                    chunk_size = 5
-                    for i in range(0, len(words), chunk_size):
-                        chunk = " ".join(words[i:i + chunk_size]) + " "
-                        yield chunk.encode('utf-8')
-                        await asyncio.sleep(0.05)
-                    yield "\n".encode('utf-8')
-                
-                return StreamingResponse(stream_generic_response(), media_type="text/markdown")
-            except (APIConnectionError, RateLimitError):
+                # Wait for the first token so provider errors still get the busy reply
+                first_token = await anext(tokens, "")
+            except llm_gateway.BUSY_ERRORS:
                 response_text = "Our Servers are busy right now, try again later."
-                chat_histories[user_id].append({"role": "assistant", "content": response_text})
+                session.add_message("assistant", response_text)
                 return StreamingResponse(stream_response(response_text), media_type="text/plain; charset=utf-8")
             # END EDIT
 
+            # Forward provider tokens as they arrive; history gets the full text at the end
+            async def stream_generic_response():
+                parts = [first_token.lstrip()]
+                suffix = policy_prompt
+                completed = False
+                try:
+                    yield parts[0].encode('utf-8')
+                    async for token in tokens:
+                        parts.append(token)
+                        yield token.encode('utf-8')
+                    completed = True
+                except llm_gateway.BUSY_ERRORS:
+                    suffix = "\n\nOur Servers are busy right now, try again later."
+                finally:
+                    await tokens.aclose()
+                    answer = "".join(parts).strip()
+                    await asyncio.shield(record_reply(user_id, answer + suffix))
+                    # Only complete answers are reused
+                    if completed and answer and question_embedding is not None:
+                        semantic_cache.store(request.content, question_embedding, answer)
+                yield (suffix + "\n").encode('utf-8')
+
+            return StreamingResponse(pacing.track_connection(stream_generic_response(), "llm_stream"), media_type="text/markdown")
+
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.post("/generate_pdf")
-async def generate_pdf_endpoint(policy_md: str = Form(...), logo: UploadFile = File(None)):
+DOCUMENT_FORMATS = {
+    "pdf": ("application/pdf", "policy.pdf"),
+    "docx": ("application/vnd.openxmlformats-officedocument.wordprocessingml.document", "policy.docx"),
+}
+
+async def render_document(kind: str, policy_md: str, logo: UploadFile = None) -> Response:
     # BEGIN EDIT: Move PNG cleanup to after PDF download
     logo_path = None
     try:
@@ -634,23 +790,40 @@ async def generate_pdf_endpoint(policy_md: str = Form(...), logo: UploadFile = F
                 temp_file.close()
                 logo_path = temp_file.name
 
-        # Generate the PDF
-        pdf_buffer = generate_pdf(policy_md, logo_path)
+        # Render in the process pool so chat streams on this worker keep flowing
+        document, timings = await render_pool.render(kind, policy_md, logo_path)
 
-        # Return the PDF as a response
+        # Return the document as a response
+        media_type, filename = DOCUMENT_FORMATS[kind]
         return Response(
-            content=pdf_buffer.getvalue(),
-            media_type="application/pdf",
-            headers={"Content-Disposition": "attachment; filename=policy.pdf"}
+            content=document,
+            media_type=media_type,
+            headers={
+                "Content-Disposition": f"attachment; filename={filename}",
+                "X-Queue-Wait-Ms": f"{timings['queue_wait_ms']:.0f}",
+                "X-Render-Ms": f"{timings['render_ms']:.0f}",
+            }
+        )
+    except HTTPException:
+        raise
+    except RenderQueueFull as e:
+        raise HTTPException(
+            status_code=503,
+            detail="Document export is busy right now, try again shortly.",
+            headers={"Retry-After": str(e.retry_after)}
         )
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to generate PDF: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to generate {kind.upper()}: {str(e)}")
     finally:
         # Clean up temporary file if it exists, after the response is sent
         if logo_path and os.path.exists(logo_path):
             os.unlink(logo_path)
     # END EDIT
 
-if __name__ == "__main__":
-    import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8088)
\ No newline at end of file
+@app.post("/generate_pdf")
+async def generate_pdf_endpoint(policy_md: str = Form(...), logo: UploadFile = File(None)):
+    return await render_document("pdf", policy_md, logo)
+
+@app.post("/generate_docx")
+async def generate_docx_endpoint(policy_md: str = Form(...), logo: UploadFile = File(None)):
+    return await render_document("docx", policy_md, logo)
@@ -0,0 +1,112 @@
+"""Compare embedding backends against the PyTorch fp32 baseline.
+
+Encodes the policy question bank (queries, validators and sample answers)
+with each backend and reports single-text latency, batch throughput and how
+closely the vectors agree with torch: per-text cosine similarity and whether
+each text's nearest neighbour in the bank stays the same.
+
+Usage:
+    python benchmark_embeddings.py
+    python benchmark_embeddings.py --backends onnx onnx-int8 --repeats 5
+"""
+import argparse
+import json
+import statistics
+import time
+from typing import Dict, List
+import numpy as np
+import settings
+from embedding_service import EMBEDDING_BACKENDS, load_embedding_model
+
+
+def load_corpus() -> List[str]:
+    with open(settings.POLICY_JSON_FILE, 'r', encoding='utf-8') as f:
+        knowledge_base = json.load(f)
+    texts = []
+    for items in knowledge_base.values():
+        for item in items:
+            texts.append(item["queries"]["q"])
+            if item.get("validator"):
+                texts.append(item["validator"])
+            texts.extend(answer for answer in item.get("valid_answers", {}).values() if answer)
+    return texts
+
+
+def encode(model, texts: List[str], batch_size: int) -> np.ndarray:
+    vectors = model.encode(texts, batch_size=batch_size, convert_to_numpy=True, normalize_embeddings=True, show_progress_bar=False)
+    return np.asarray(vectors, dtype=np.float32)
+
+
+def benchmark_backend(backend: str, texts: List[str], repeats: int, batch_size: int) -> Dict:
+    start = time.perf_counter()
+    model = load_embedding_model(settings.EMBEDDING_MODEL_NAME, backend, settings.EMBEDDING_ONNX_INT8_FILE)
+    load_seconds = time.perf_counter() - start
+    encode(model, texts[:batch_size], batch_size)  # warm up
+
+    single_ms = []
+    for _ in range(repeats):
+        for text in texts:
+            start = time.perf_counter()
+            encode(model, [text], 1)
+            single_ms.append((time.perf_counter() - start) * 1000)
+
+    batch_seconds = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        vectors = encode(model, texts, batch_size)
+        batch_seconds.append(time.perf_counter() - start)
+
+    return {
+        "backend": backend,
+        "load_s": load_seconds,
+        "single_p50_ms": statistics.median(single_ms),
+        "single_p95_ms": float(np.percentile(single_ms, 95)),
+        "batch_docs_per_s": len(texts) / statistics.median(batch_seconds),
+        "vectors": vectors,
+    }
+
+
+def agreement(vectors: np.ndarray, baseline: np.ndarray) -> Dict:
+    cosines = np.sum(vectors * baseline, axis=1)
+
+    def nearest(matrix):
+        scores = matrix @ matrix.T
+        np.fill_diagonal(scores, -np.inf)
+        return np.argmax(scores, axis=1)
+
+    return {
+        "cos_mean": float(cosines.mean()),
+        "cos_min": float(cosines.min()),
+        "top1_agree": float(np.mean(nearest(vectors) == nearest(baseline))),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--backends", nargs="+", default=["onnx", "onnx-int8"], choices=EMBEDDING_BACKENDS)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--batch-size", type=int, default=settings.EMBEDDING_BATCH_SIZE)
+    args = parser.parse_args()
+
+    texts = load_corpus()
+    print(f"Corpus: {len(texts)} texts, model {settings.EMBEDDING_MODEL_NAME}")
+    baseline = benchmark_backend("torch", texts, args.repeats, args.batch_size)
+    results = [baseline] + [
+        benchmark_backend(backend, texts, args.repeats, args.batch_size)
+        for backend in args.backends if backend != "torch"
+    ]
+
+    header = f"{'backend':<10} {'load s':>7} {'p50 ms':>8} {'p95 ms':>8} {'docs/s':>8} {'cos mean':>9} {'cos min':>8} {'top1':>6}"
+    print(header)
+    print("-" * len(header))
+    for result in results:
+        agree = agreement(result["vectors"], baseline["vectors"])
+        print(
+            f"{result['backend']:<10} {result['load_s']:>7.2f} {result['single_p50_ms']:>8.2f} "
+            f"{result['single_p95_ms']:>8.2f} {result['batch_docs_per_s']:>8.1f} "
+            f"{agree['cos_mean']:>9.4f} {agree['cos_min']:>8.4f} {agree['top1_agree']:>6.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
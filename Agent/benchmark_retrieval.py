@@ -0,0 +1,86 @@
+"""Compare generic-mode retrieval through Chroma against the in-memory NumPy index.
+
+Builds the generic collection in a temporary Chroma directory, loads the same
+vectors into a NumpyIndex and runs the policy question bank against both:
+raw top-k search with precomputed query vectors, and the full LangChain
+retriever path (query embeddings served from a warm cache). Reports p50/p95
+latency and how often the two backends return the same top-k chunks.
+
+Usage:
+    python benchmark_retrieval.py
+    python benchmark_retrieval.py --k 8 --repeats 20
+"""
+import argparse
+import statistics
+import tempfile
+import time
+from typing import Callable, Dict, List
+import numpy as np
+from langchain_chroma import Chroma
+import settings
+from benchmark_embeddings import load_corpus
+from embedding_service import EmbeddingService, LangChainEmbeddings, load_embedding_model
+from index_builder import CHUNKER_SETTINGS, generic_entries, load_and_split_documents, sync_collection
+from numpy_index import NumpyIndex, NumpyRetriever
+
+
+def time_calls(fn: Callable, inputs: List, repeats: int) -> Dict:
+    timings = []
+    for _ in range(repeats):
+        for item in inputs:
+            start = time.perf_counter()
+            fn(item)
+            timings.append((time.perf_counter() - start) * 1000)
+    return {"p50_ms": statistics.median(timings), "p95_ms": float(np.percentile(timings, 95))}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--k", type=int, default=settings.RETRIEVAL_K)
+    parser.add_argument("--repeats", type=int, default=10)
+    args = parser.parse_args()
+
+    model = load_embedding_model(settings.EMBEDDING_MODEL_NAME, settings.EMBEDDING_BACKEND, settings.EMBEDDING_ONNX_INT8_FILE)
+    service = EmbeddingService(model, cache_size=settings.EMBEDDING_CACHE_SIZE)
+    queries = load_corpus()
+    query_vectors = list(service.encode_batch(queries))  # also warms the query cache
+
+    with tempfile.TemporaryDirectory() as chroma_dir:
+        vector_store = Chroma(
+            collection_name=settings.GENERIC_COLLECTION_NAME,
+            embedding_function=LangChainEmbeddings(service, settings.EMBEDDING_BATCH_SIZE),
+            persist_directory=chroma_dir,
+        )
+        ids, texts, metadatas = generic_entries(load_and_split_documents(settings.GENERIC_JSON_FILE))
+        sync_collection(vector_store._collection, ids, texts, metadatas, service,
+                        chunker=CHUNKER_SETTINGS, manifest_path=f"{chroma_dir}/index_manifest.json")
+        collection = vector_store._collection
+        index = NumpyIndex.from_collection(collection)
+        print(f"Corpus: {len(index)} chunks, {len(queries)} queries, k={args.k}, model {settings.EMBEDDING_MODEL_NAME} ({settings.EMBEDDING_BACKEND})")
+
+        chroma_retriever = vector_store.as_retriever(search_kwargs={"k": args.k})
+        numpy_retriever = NumpyRetriever(index=index, embedder=service, search_kwargs={"k": args.k})
+        rows = [
+            ("chroma search", time_calls(lambda v: collection.query(query_embeddings=[v.tolist()], n_results=args.k), query_vectors, args.repeats)),
+            ("numpy search", time_calls(lambda v: index.search(v, args.k), query_vectors, args.repeats)),
+            ("chroma retriever", time_calls(chroma_retriever.invoke, queries, args.repeats)),
+            ("numpy retriever", time_calls(numpy_retriever.invoke, queries, args.repeats)),
+        ]
+
+        same_set = same_order = 0
+        for vector in query_vectors:
+            chroma_ids = collection.query(query_embeddings=[vector.tolist()], n_results=args.k)["ids"][0]
+            numpy_ids = [index.ids[row] for row, _ in index.search(vector, args.k)]
+            same_set += set(chroma_ids) == set(numpy_ids)
+            same_order += chroma_ids == numpy_ids
+
+    header = f"{'path':<18} {'p50 ms':>8} {'p95 ms':>8}"
+    print(header)
+    print("-" * len(header))
+    for name, result in rows:
+        print(f"{name:<18} {result['p50_ms']:>8.3f} {result['p95_ms']:>8.3f}")
+    print(f"Top-{args.k} agreement: same set {same_set / len(queries):.2%}, same order {same_order / len(queries):.2%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,38 @@
+"""Build the prebuilt index snapshot that api.py loads at startup.
+
+Chunks the generic knowledge base, normalizes the policy question bank and
+embeds both with the configured model and backend, then writes a versioned,
+checksummed snapshot (see index_builder.write_snapshot). Run it at image
+build time so new containers skip chunking and corpus embedding entirely.
+
+Usage:
+    python -m build_index
+    python -m build_index --output /tmp/index_snapshot --verify
+"""
+import argparse
+import logging
+import sys
+import settings
+from embedding_service import EmbeddingService, load_embedding_model
+from index_builder import load_snapshot, write_snapshot
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--output", default=settings.INDEX_SNAPSHOT_PATH)
+    parser.add_argument("--batch-size", type=int, default=settings.EMBEDDING_BATCH_SIZE)
+    parser.add_argument("--verify", action="store_true", help="only check an existing snapshot")
+    args = parser.parse_args()
+    logging.basicConfig(level=settings.LOG_LEVEL, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    if not args.verify:
+        model = load_embedding_model(settings.EMBEDDING_MODEL_NAME, settings.EMBEDDING_BACKEND, settings.EMBEDDING_ONNX_INT8_FILE)
+        manifest = write_snapshot(args.output, EmbeddingService(model, cache_size=0), args.batch_size)
+        print(f"Snapshot {args.output}: {manifest['counts']} ({manifest['embedding_backend']}, dim {manifest['dimension']})")
+    if load_snapshot(args.output) is None:
+        print(f"Snapshot {args.output} is missing, stale or corrupt", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
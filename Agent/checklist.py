@@ -0,0 +1,113 @@
+import sys
+from typing import Callable, Dict, List, Optional
+
+HEADER = "| Title | Citation | Query | Answer | Compliance | Comments |\n|-------|----------|-------|--------|------------|----------|\n"
+
+
+class Checklist:
+    """Per-session checklist of policy answers, kept up to date as answers come in.
+
+    `record()` files an answer under its question in O(1) instead of the
+    checklist being rebuilt from the chat history. Rows and the markdown
+    table are rendered from this state on demand and cached; an answer only
+    invalidates the cached output and its own row.
+    """
+
+    def __init__(self):
+        # question index -> {"rejected": [answer, ...], "accepted": answer or None}
+        self._answers: Dict[int, Dict] = {}
+        self._row_cache: Dict[int, Dict] = {}
+        self._line_cache: Dict[int, str] = {}
+        self._rows: Optional[List[Dict]] = None
+        self._markdown: Optional[str] = None
+
+    def __len__(self) -> int:
+        return len(self._answers)
+
+    def record(self, question_index: int, answer: str, compliant: bool):
+        """Add a validated answer; a later compliant answer replaces an earlier one."""
+        entry = self._answers.get(question_index)
+        if entry is None:
+            entry = self._answers[question_index] = {"rejected": [], "accepted": None}
+        if compliant:
+            entry["accepted"] = answer
+        else:
+            entry["rejected"].append(answer)
+        self._row_cache.pop(question_index, None)
+        self._line_cache.pop(question_index, None)
+        self._rows = None
+        self._markdown = None
+
+    def _row(self, question_index: int, question: Dict) -> Dict:
+        row = self._row_cache.get(question_index)
+        if row is None:
+            entry = self._answers[question_index]
+            answer_text = "".join(f"~~{answer.replace('|', ' ')}~~ " for answer in entry["rejected"])
+            comments = "Answer accepted as compliant."
+            if entry["accepted"] is not None:
+                answer_text += entry["accepted"].replace('|', ' ')
+                if entry["rejected"]:
+                    comments = "Initially non-compliant; corrected answer accepted."
+            row = self._row_cache[question_index] = {
+                "Title": question["title"],
+                "Citation": question["citation"],
+                "Query": question["query"],
+                "Answer": answer_text,
+                "Compliance": "✅ Compliant",
+                "Comments": comments,
+            }
+        return row
+
+    def rows(self, questions: List[Dict]) -> List[Dict]:
+        """One row per answered question, in questionnaire order."""
+        if self._rows is None:
+            self._rows = [self._row(idx, questions[idx]) for idx in sorted(self._answers) if idx < len(questions)]
+        return self._rows
+
+    def markdown(self, questions: List[Dict]) -> str:
+        if self._markdown is None:
+            lines = [HEADER]
+            for idx in sorted(self._answers):
+                if idx >= len(questions):
+                    continue
+                line = self._line_cache.get(idx)
+                if line is None:
+                    line = self._line_cache[idx] = render_row(self._row(idx, questions[idx]))
+                lines.append(line)
+            self._markdown = "".join(lines)
+        return self._markdown
+
+    def approx_bytes(self) -> int:
+        """Rough size of the stored answers; rendered output is not counted."""
+        return sum(
+            sys.getsizeof(entry) + sum(sys.getsizeof(answer) for answer in entry["rejected"]) + sys.getsizeof(entry["accepted"])
+            for entry in self._answers.values()
+        )
+
+    def to_dict(self) -> Dict:
+        return {str(idx): entry for idx, entry in self._answers.items()}
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "Checklist":
+        checklist = cls()
+        for idx, entry in data.items():
+            checklist._answers[int(idx)] = {"rejected": list(entry.get("rejected", [])), "accepted": entry.get("accepted")}
+        return checklist
+
+    @classmethod
+    def from_history(cls, history: List, text: Callable) -> "Checklist":
+        """Rebuild from the validated answers in a chat history, for sessions saved before checklists were kept."""
+        checklist = cls()
+        for message in history:
+            if message.role == "user" and message.question_index is not None:
+                checklist.record(message.question_index, text(message), message.compliant)
+        return checklist
+
+
+def render_row(row: Dict) -> str:
+    return f"| {row['Title'].replace('|', ' ')} | {row['Citation']} | {row['Query'].replace('|', ' ')} | {row['Answer']} | {row['Compliance']} | {row['Comments'].replace('|', ' ')} |\n"
+
+
+def render_table(rows: List[Dict]) -> str:
+    """Markdown table for any list of checklist rows, e.g. the rows of one policy section."""
+    return HEADER + "".join(render_row(row) for row in rows)
@@ -0,0 +1,273 @@
+import asyncio
+import logging
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+logger = logging.getLogger(__name__)
+
+
+EMBEDDING_BACKENDS = ("torch", "onnx", "onnx-int8")
+
+
+def load_embedding_model(model_name: str, backend: str = "torch", onnx_int8_file: str = None):
+    """Load the SentenceTransformer on the requested inference backend.
+
+    "onnx" runs the exported fp32 graph on ONNX Runtime; "onnx-int8" loads a
+    dynamically quantized graph (`onnx_int8_file`, relative to the model repo).
+    """
+    from sentence_transformers import SentenceTransformer
+
+    if backend == "torch":
+        return SentenceTransformer(model_name)
+    if backend == "onnx":
+        return SentenceTransformer(model_name, backend="onnx")
+    if backend == "onnx-int8":
+        return SentenceTransformer(model_name, backend="onnx", model_kwargs={"file_name": onnx_int8_file})
+    raise ValueError(f"Unknown embedding backend '{backend}'; expected one of {EMBEDDING_BACKENDS}")
+
+
+def normalize_text(text: str) -> str:
+    """Cache key for a text: NFC-normalized with whitespace collapsed."""
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+class EmbeddingService:
+    """Single entry point for sentence embeddings.
+
+    Wraps the shared SentenceTransformer and memoizes results in an LRU
+    keyed by normalized text. Every vector returned is float32 and
+    L2-normalized, so cosine similarity is a plain dot product. Safe to call
+    from worker threads.
+    """
+
+    def __init__(self, model, cache_size: int = 4096):
+        self.model = model
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def dimension(self) -> int:
+        return self.model.get_sentence_embedding_dimension()
+
+    def _encode_uncached(self, texts: List[str], batch_size: int = 32) -> np.ndarray:
+        vectors = self.model.encode(
+            texts,
+            batch_size=batch_size,
+            convert_to_numpy=True,
+            normalize_embeddings=True,
+            show_progress_bar=False,
+        )
+        return np.asarray(vectors, dtype=np.float32)
+
+    def _cache_get(self, key: str, count_miss: bool = True):
+        with self._lock:
+            vector = self._cache.get(key)
+            if vector is None:
+                if count_miss:
+                    self.misses += 1
+                return None
+            self._cache.move_to_end(key)
+            self.hits += 1
+            return vector
+
+    def _cache_put(self, key: str, vector: np.ndarray):
+        if self.cache_size <= 0:
+            return
+        vector.setflags(write=False)
+        with self._lock:
+            self._cache[key] = vector
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def cached(self, text: str) -> Optional[np.ndarray]:
+        """Return the cached vector for `text`, or None without encoding it."""
+        return self._cache_get(normalize_text(text), count_miss=False)
+
+    def encode(self, text: str) -> np.ndarray:
+        """Embed one text, served from the cache when possible. The result is read-only."""
+        key = normalize_text(text)
+        vector = self._cache_get(key)
+        if vector is None:
+            vector = self._encode_uncached([key])[0]
+            self._cache_put(key, vector)
+        return vector
+
+    def encode_batch(self, texts: List[str], batch_size: int = 32) -> np.ndarray:
+        """Embed many texts; cached ones are reused and the rest go through the model together."""
+        keys = [normalize_text(text) for text in texts]
+        vectors: List[np.ndarray] = [self._cache_get(key) for key in keys]
+        missing = list(dict.fromkeys(key for key, vector in zip(keys, vectors) if vector is None))
+        if missing:
+            encoded = dict(zip(missing, self._encode_uncached(missing, batch_size)))
+            for key, vector in encoded.items():
+                self._cache_put(key, vector)
+            vectors = [vector if vector is not None else encoded[key] for key, vector in zip(keys, vectors)]
+        if not vectors:
+            return np.zeros((0, self.dimension), dtype=np.float32)
+        return np.stack(vectors)
+
+    def encode_corpus(self, texts: List[str], batch_size: int = 32, label: str = "corpus") -> np.ndarray:
+        """Embed an index corpus in batches, bypassing the query cache.
+
+        Logs progress and throughput (docs/sec) after every batch so cold
+        starts and re-indexing runs can be timed from the logs.
+        """
+        batch_size = max(1, batch_size)
+        start = time.perf_counter()
+        batches = []
+        for offset in range(0, len(texts), batch_size):
+            batches.append(self._encode_uncached(texts[offset:offset + batch_size], batch_size))
+            done = min(offset + batch_size, len(texts))
+            elapsed = time.perf_counter() - start
+            logger.info("Embedding %s: %d/%d docs, %.1f docs/sec", label, done, len(texts), done / elapsed if elapsed else 0.0)
+        if not batches:
+            return np.zeros((0, self.dimension), dtype=np.float32)
+        elapsed = time.perf_counter() - start
+        logger.info("Embedded %d %s docs in %.2fs (batch size %d)", len(texts), label, elapsed, batch_size)
+        return np.concatenate(batches)
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            "cache_entries": len(self._cache),
+            "cache_size": self.cache_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+class EmbeddingBatcher:
+    """Async front end that micro-batches encode requests from concurrent handlers.
+
+    Requests are queued; a background task collects up to `max_batch` texts
+    or waits at most `max_wait_ms` after the first one, then encodes the batch
+    on a dedicated worker thread and resolves each caller's future. Cache hits
+    are answered immediately without queueing. Model inference never runs on
+    the event loop.
+    """
+
+    def __init__(self, service: EmbeddingService, max_batch: int = 16, max_wait_ms: float = 5):
+        self.service = service
+        self.max_batch = max(1, max_batch)
+        self.max_wait = max_wait_ms / 1000
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="embedding-batcher")
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self.batches = 0
+        self.texts = 0
+        self.largest_batch = 0
+
+    def _ensure_worker(self):
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+        if self._worker is None or self._worker.done():
+            # A restarted worker picks up whatever is still queued
+            self._worker = asyncio.get_running_loop().create_task(self._run())
+
+    async def encode(self, text: str) -> np.ndarray:
+        vector = self.service.cached(text)
+        if vector is not None:
+            return vector
+        self._ensure_worker()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((text, future))
+        return await future
+
+    async def _collect(self, batch: List[tuple]):
+        """Fill `batch` in place, so requests already taken off the queue are not lost if the worker dies."""
+        batch.append(await self._queue.get())
+        deadline = asyncio.get_running_loop().time() + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - asyncio.get_running_loop().time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+
+    @staticmethod
+    def _fail(batch: List[tuple], error: BaseException):
+        for _, future in batch:
+            if not future.done():
+                future.set_exception(error)
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch: List[tuple] = []
+            try:
+                await self._collect(batch)
+                # Callers that gave up (e.g. client disconnected) are dropped
+                batch = [(text, future) for text, future in batch if not future.cancelled()]
+                if not batch:
+                    continue
+                texts = [text for text, _ in batch]
+                vectors = await loop.run_in_executor(self._executor, self.service.encode_batch, texts, self.max_batch)
+            except Exception as e:
+                self._fail(batch, e)
+                continue
+            except BaseException:
+                # Cancelled or dying: nobody else will resolve this batch
+                self._fail(batch, RuntimeError("Embedding worker stopped"))
+                raise
+            self.batches += 1
+            self.texts += len(texts)
+            self.largest_batch = max(self.largest_batch, len(texts))
+            for (_, future), vector in zip(batch, vectors):
+                if not future.done():
+                    future.set_result(vector)
+
+    async def close(self):
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+        if self._queue is not None:
+            queued = []
+            while not self._queue.empty():
+                queued.append(self._queue.get_nowait())
+            self._fail(queued, RuntimeError("Embedding batcher closed"))
+        self._executor.shutdown(wait=False)
+
+    def stats(self) -> Dict:
+        return {
+            "batches": self.batches,
+            "texts": self.texts,
+            "avg_batch": round(self.texts / self.batches, 2) if self.batches else 0.0,
+            "largest_batch": self.largest_batch,
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+        }
+
+
+class LangChainEmbeddings(Embeddings):
+    """LangChain `Embeddings` adapter over an EmbeddingService.
+
+    Lets the Chroma vector store embed through the same SentenceTransformer
+    instance (and query cache) as the rest of the app instead of loading a
+    second copy of the weights via HuggingFaceEmbeddings.
+    """
+
+    def __init__(self, service: EmbeddingService, batch_size: int = 32):
+        self.service = service
+        self.batch_size = batch_size
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.service.encode_corpus(list(texts), self.batch_size, label="documents").tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.service.encode(text).tolist()
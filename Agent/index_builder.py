@@ -0,0 +1,396 @@
+import os
+import json
+import hashlib
+import logging
+import shutil
+import time
+import unicodedata
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+import settings
+
+logger = logging.getLogger(__name__)
+
+# Part of every generic-collection manifest: changing it re-chunks and re-embeds everything
+CHUNKER_SETTINGS = {
+    "chunk_size": 2000,
+    "chunk_overlap": 250,
+    "separators": ["\n\n", "\n", " ", ""],
+}
+MANIFEST_VERSION = 1
+SNAPSHOT_VERSION = 1
+
+class Document:
+    def __init__(self, page_content: str, metadata: Dict):
+        self.page_content = page_content
+        self.metadata = metadata
+
+def normalize_string(s):
+    return unicodedata.normalize('NFC', s)
+
+def load_and_split_documents(json_file: str) -> List[Document]:
+    # A missing or malformed file raises, failing the warmup stage that loads it
+    with open(json_file, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+
+    documents = []
+    # Add LangChain text splitter for chunking
+    text_splitter = RecursiveCharacterTextSplitter(**CHUNKER_SETTINGS)
+
+    core_functions = data.get("NIST_AI_RMF_Overview", {}).get("5_How_Does_It_Address_and_Manage_Risks", {}).get("Core_Functions", {})
+    for section, content in core_functions.items():
+        sub_functions = content.get("Sub_Functions", {})
+        sub_points = [
+            {"id": key.replace("_", " "), "description": normalize_string(value)}
+            for key, value in sub_functions.items()
+        ]
+        content_text = f"{section}\n"
+        for sub_point in sub_points:
+            content_text += f"{sub_point['id']}: {sub_point['description']}\n"
+        # Split the content text into chunks
+        chunks = text_splitter.split_text(content_text)
+        for chunk in chunks:
+            documents.append(Document(
+                page_content=chunk,
+                metadata={"section": section}
+            ))
+
+    overview = data.get("NIST_AI_RMF_Overview", {})
+    for key, value in overview.items():
+        if key == "5_How_Does_It_Address_and_Manage_Risks":
+            continue
+        content_text = f"{key.replace('_', ' ')}\n"
+        def flatten_dict(d, parent_key=''):
+            items = []
+            for k, v in d.items():
+                new_key = f"{parent_key}_{k}" if parent_key else k
+                if isinstance(v, dict):
+                    items.extend(flatten_dict(v, new_key).items())
+                elif isinstance(v, list):
+                    items.append((new_key, ", ".join(v)))
+                else:
+                    items.append((new_key, v))
+            return dict(items)
+
+        flat_content = flatten_dict(value)
+        for k, v in flat_content.items():
+            content_text += f"{k.replace('_', ' ')}: {normalize_string(str(v))}\n"
+        # Split the content text into chunks
+        chunks = text_splitter.split_text(content_text)
+        for chunk in chunks:
+            documents.append(Document(
+                page_content=chunk,
+                metadata={"section": key.replace('_', ' ')}
+            ))
+
+    for key, value in data.items():
+        if key != "NIST_AI_RMF_Overview":
+            content_text = f"{key.replace('_', ' ')}\n"
+            flat_content = flatten_dict(value)
+            for k, v in flat_content.items():
+                content_text += f"{k.replace('_', ' ')}: {normalize_string(str(v))}\n"
+            # Split the content text into chunks
+            chunks = text_splitter.split_text(content_text)
+            for chunk in chunks:
+                documents.append(Document(
+                    page_content=chunk,
+                    metadata={"section": key.replace('_', ' ')}
+                ))
+
+    return documents
+
+def ensure_collection_backend(collection):
+    """Stamp an empty collection with the embedding setup, or reject one built with another backend.
+
+    Vectors from different backends are close but not identical, so mixing
+    them in one collection would silently skew similarity scores.
+    """
+    stamp = {"embedding_model": settings.EMBEDDING_MODEL_NAME, "embedding_backend": settings.EMBEDDING_BACKEND}
+    if collection.count() == 0:
+        collection.modify(metadata=stamp)
+        return
+    # Collections built before the backend was configurable were built with torch
+    built_with = (collection.metadata or {}).get("embedding_backend", "torch")
+    if built_with != settings.EMBEDDING_BACKEND:
+        raise RuntimeError(
+            f"Collection '{collection.name}' was built with the '{built_with}' embedding backend, "
+            f"but models.embedding_backend is '{settings.EMBEDDING_BACKEND}'. "
+            f"Delete {settings.CHROMA_DB_PATH} to rebuild it or switch the backend back."
+        )
+
+def generic_entries(documents: List[Document]) -> Tuple[List[str], List[str], List[Dict]]:
+    """Stable ids, texts and metadata for the generic collection.
+
+    A chunk's id is its section plus its position within that section, so
+    editing one section only changes the ids/hashes of that section's chunks.
+    """
+    ids, texts, metadatas = [], [], []
+    positions: Dict[str, int] = {}
+    for doc in documents:
+        section = doc.metadata.get("section", "")
+        position = positions.get(section, 0)
+        positions[section] = position + 1
+        ids.append(f"{section}::{position}")
+        texts.append(doc.page_content)
+        metadatas.append(doc.metadata)
+    return ids, texts, metadatas
+
+def policy_entries(knowledge_base: Dict) -> Tuple[List[str], List[str], List[Dict]]:
+    """Ids, texts and metadata for the policy question bank (queries and validators)."""
+    ids, texts, metadatas = [], [], []
+    for category, items in knowledge_base.items():
+        for item in items:
+            ids.append(f"{category}_{item['title']}_query")
+            texts.append(item["queries"]["q"])
+            metadatas.append({"type": "query", "category": category, "title": item["title"]})
+            if item.get("validator"):
+                ids.append(f"{category}_{item['title']}_validator")
+                texts.append(item["validator"])
+                metadatas.append({"type": "validator", "category": category, "title": item["title"]})
+    return ids, texts, metadatas
+
+def chunk_hash(text: str, metadata: Dict) -> str:
+    payload = json.dumps({"text": text, "metadata": metadata}, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def load_manifest(path: str) -> Dict:
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        if manifest.get("version") == MANIFEST_VERSION:
+            return manifest
+        logger.warning("Ignoring index manifest %s with unsupported version %s", path, manifest.get("version"))
+    except FileNotFoundError:
+        pass
+    except (OSError, ValueError) as e:
+        logger.warning("Ignoring unreadable index manifest %s: %s", path, e)
+    return {"version": MANIFEST_VERSION, "collections": {}}
+
+def save_manifest(path: str, manifest: Dict):
+    """Write the manifest atomically so a crash never leaves a half-written file."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+def sync_collection(collection, ids: List[str], texts: List[str], metadatas: List[Dict], embedder,
+                    chunker: Dict = None, manifest_path: str = None, batch_size: int = None,
+                    vectors: Optional[np.ndarray] = None) -> Dict:
+    """Bring a Chroma collection in line with its source chunks, touching only what changed.
+
+    The manifest next to the collections records, per collection, a content
+    hash for every chunk plus the embedding model, backend and chunker
+    settings. Changed or new chunks are re-embedded and upserted, removed
+    chunks are deleted. A different embedding/chunker signature, a missing
+    manifest entry or a collection whose size does not match the manifest
+    (e.g. built by an older version, or edited by hand) triggers a full rebuild.
+
+    `vectors`, when given, holds precomputed embeddings aligned with `ids`
+    (e.g. from an index snapshot) and no text is embedded at all.
+    """
+    manifest_path = manifest_path or settings.INDEX_MANIFEST_PATH
+    batch_size = batch_size or settings.EMBEDDING_BATCH_SIZE
+    ensure_collection_backend(collection)
+
+    start = time.perf_counter()
+    manifest = load_manifest(manifest_path)
+    signature = {
+        "embedding_model": settings.EMBEDDING_MODEL_NAME,
+        "embedding_backend": settings.EMBEDDING_BACKEND,
+        "chunker": chunker,
+    }
+    hashes = {chunk_id: chunk_hash(text, metadata) for chunk_id, text, metadata in zip(ids, texts, metadatas)}
+    entry = manifest["collections"].get(collection.name)
+
+    full_rebuild = (
+        entry is None
+        or entry.get("signature") != signature
+        or collection.count() != len(entry.get("chunks", {}))
+    )
+    if full_rebuild:
+        stale_ids = collection.get(include=[])["ids"]
+        changed = list(hashes)
+        removed = [chunk_id for chunk_id in stale_ids if chunk_id not in hashes]
+    else:
+        previous = entry["chunks"]
+        changed = [chunk_id for chunk_id, digest in hashes.items() if previous.get(chunk_id) != digest]
+        removed = [chunk_id for chunk_id in previous if chunk_id not in hashes]
+
+    if removed:
+        collection.delete(ids=removed)
+    if changed:
+        positions = {chunk_id: i for i, chunk_id in enumerate(ids)}
+        changed_texts = [texts[positions[chunk_id]] for chunk_id in changed]
+        if vectors is not None:
+            changed_vectors = np.asarray(vectors[[positions[chunk_id] for chunk_id in changed]])
+        else:
+            changed_vectors = embedder.encode_corpus(changed_texts, batch_size, label=collection.name)
+        collection.upsert(
+            ids=changed,
+            documents=changed_texts,
+            embeddings=changed_vectors.tolist(),
+            metadatas=[metadatas[positions[chunk_id]] for chunk_id in changed],
+        )
+    if full_rebuild:
+        collection.modify(metadata={
+            "embedding_model": settings.EMBEDDING_MODEL_NAME,
+            "embedding_backend": settings.EMBEDDING_BACKEND,
+        })
+
+    manifest["collections"][collection.name] = {"signature": signature, "chunks": hashes, "updated_at": time.time()}
+    save_manifest(manifest_path, manifest)
+
+    report = {
+        "collection": collection.name,
+        "full_rebuild": full_rebuild,
+        "upserted": len(changed),
+        "deleted": len(removed),
+        "unchanged": len(hashes) - len(changed),
+        "seconds": round(time.perf_counter() - start, 3),
+    }
+    logger.info(
+        "Index %s: %s, %d upserted, %d deleted, %d unchanged in %.2fs",
+        collection.name, "full rebuild" if full_rebuild else "incremental",
+        report["upserted"], report["deleted"], report["unchanged"], report["seconds"],
+    )
+    return report
+
+def question_bank(knowledge_base: Dict) -> List[Dict]:
+    """The policy questions in asking order, normalized, with both sample answers."""
+    bank = []
+    for category, items in knowledge_base.items():
+        for item in items:
+            valid_answers = item.get("valid_answers", {})
+            bank.append({
+                "category": category,
+                "title": normalize_string(item["title"]),
+                "query": normalize_string(item["queries"]["q"]),
+                "citation": item["citation"],
+                "validator": item.get("validator", ""),
+                "valid_answers": [valid_answers.get("va1", ""), valid_answers.get("va2", "")] if valid_answers else [],
+            })
+    return bank
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def source_hashes() -> Dict[str, str]:
+    return {
+        "generic": file_sha256(settings.GENERIC_JSON_FILE),
+        "policy": file_sha256(settings.POLICY_JSON_FILE),
+    }
+
+def snapshot_signature() -> Dict:
+    """What a snapshot must have been built with to be usable by this process."""
+    return {
+        "version": SNAPSHOT_VERSION,
+        "embedding_model": settings.EMBEDDING_MODEL_NAME,
+        "embedding_backend": settings.EMBEDDING_BACKEND,
+        "chunker": CHUNKER_SETTINGS,
+    }
+
+def write_snapshot(path: str, embedder, batch_size: int = None) -> Dict:
+    """Chunk and embed both knowledge bases and write them to `path` as a snapshot.
+
+    Layout: `generic.json` / `policy.json` (ids, texts, metadata),
+    `questions.json` (the normalized question bank), `generic.npy` /
+    `policy.npy` (float32 L2-normalized embeddings) and `manifest.json`
+    with the build signature, source hashes and a sha256 per file. The
+    snapshot is written to a temporary directory and swapped in at the end.
+    """
+    batch_size = batch_size or settings.EMBEDDING_BATCH_SIZE
+    start = time.perf_counter()
+    with open(settings.POLICY_JSON_FILE, 'r', encoding='utf-8') as f:
+        knowledge_base = json.load(f)
+    collections = {
+        "generic": generic_entries(load_and_split_documents(settings.GENERIC_JSON_FILE)),
+        "policy": policy_entries(knowledge_base),
+    }
+
+    tmp_path = f"{path}.tmp"
+    if os.path.isdir(tmp_path):
+        shutil.rmtree(tmp_path)
+    os.makedirs(tmp_path)
+    counts = {}
+    for name, (ids, texts, metadatas) in collections.items():
+        vectors = embedder.encode_corpus(texts, batch_size, label=name)
+        np.save(os.path.join(tmp_path, f"{name}.npy"), np.ascontiguousarray(vectors, dtype=np.float32))
+        with open(os.path.join(tmp_path, f"{name}.json"), 'w', encoding='utf-8') as f:
+            json.dump({"ids": ids, "texts": texts, "metadatas": metadatas}, f, ensure_ascii=False)
+        counts[name] = len(ids)
+    with open(os.path.join(tmp_path, "questions.json"), 'w', encoding='utf-8') as f:
+        json.dump(question_bank(knowledge_base), f, ensure_ascii=False)
+
+    files = sorted(os.listdir(tmp_path))
+    manifest = {
+        **snapshot_signature(),
+        "dimension": embedder.dimension,
+        "created_at": time.time(),
+        "counts": counts,
+        "sources": source_hashes(),
+        "files": {name: file_sha256(os.path.join(tmp_path, name)) for name in files},
+    }
+    with open(os.path.join(tmp_path, "manifest.json"), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    os.replace(tmp_path, path)
+    logger.info("Wrote index snapshot %s (%s) in %.2fs", path, counts, time.perf_counter() - start)
+    return manifest
+
+class IndexSnapshot:
+    """A verified snapshot on disk; embeddings are memory-mapped read-only."""
+
+    def __init__(self, path: str, manifest: Dict):
+        self.path = path
+        self.manifest = manifest
+        with open(os.path.join(path, "questions.json"), 'r', encoding='utf-8') as f:
+            self.questions: List[Dict] = json.load(f)
+
+    def entries(self, name: str) -> Tuple[List[str], List[str], List[Dict]]:
+        with open(os.path.join(self.path, f"{name}.json"), 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        return data["ids"], data["texts"], data["metadatas"]
+
+    def vectors(self, name: str) -> np.ndarray:
+        return np.load(os.path.join(self.path, f"{name}.npy"), mmap_mode="r")
+
+def load_snapshot(path: str) -> Optional[IndexSnapshot]:
+    """Return the snapshot at `path` if it is intact and matches the current sources and settings.
+
+    Anything else (missing, built for another model/backend/chunker, built
+    from different knowledge-base files, or failing a checksum) is logged
+    and None is returned so the caller falls back to embedding at startup.
+    """
+    manifest_file = os.path.join(path, "manifest.json")
+    if not os.path.exists(manifest_file):
+        logger.info("No index snapshot at %s", path)
+        return None
+    try:
+        with open(manifest_file, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        expected = snapshot_signature()
+        mismatched = [key for key, value in expected.items() if manifest.get(key) != value]
+        if mismatched:
+            logger.warning("Ignoring index snapshot %s: built with different %s", path, ", ".join(mismatched))
+            return None
+        if manifest.get("sources") != source_hashes():
+            logger.warning("Ignoring index snapshot %s: knowledge-base files changed since it was built", path)
+            return None
+        for name, digest in manifest["files"].items():
+            if file_sha256(os.path.join(path, name)) != digest:
+                logger.warning("Ignoring index snapshot %s: checksum mismatch for %s", path, name)
+                return None
+        snapshot = IndexSnapshot(path, manifest)
+    except (OSError, ValueError, KeyError) as e:
+        logger.warning("Ignoring unreadable index snapshot %s: %s", path, e)
+        return None
+    logger.info("Using index snapshot %s built at %s", path, time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(manifest["created_at"])))
+    return snapshot
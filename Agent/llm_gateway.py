@@ -0,0 +1,133 @@
+import asyncio
+from typing import AsyncGenerator, Dict, List
+from litellm import acompletion, APIConnectionError, RateLimitError, Timeout
+import settings
+
+# Errors that mean "the provider is busy or unreachable"; callers answer these
+# with the "Our Servers are busy" message instead of a 500.
+BUSY_ERRORS = (APIConnectionError, RateLimitError, Timeout)
+
+_semaphores: Dict[str, asyncio.Semaphore] = {}
+_stats: Dict[str, Dict] = {}
+
+
+def model_limits(model: str) -> Dict:
+    """Return the concurrency limit and timeout configured for a model id."""
+    limits = settings.LLM_MODEL_LIMITS.get(model, {})
+    return {
+        "max_concurrency": limits.get("max_concurrency", settings.LLM_DEFAULT_MAX_CONCURRENCY),
+        "timeout": limits.get("timeout", settings.LLM_DEFAULT_TIMEOUT),
+    }
+
+
+def _semaphore_for(model: str) -> asyncio.Semaphore:
+    semaphore = _semaphores.get(model)
+    if semaphore is None:
+        semaphore = asyncio.Semaphore(model_limits(model)["max_concurrency"])
+        _semaphores[model] = semaphore
+    return semaphore
+
+
+def _stats_for(model: str) -> Dict:
+    return _stats.setdefault(model, {"in_flight": 0, "waiting": 0, "completed": 0, "failed": 0, "timeouts": 0})
+
+
+def _timeout_error(model: str, timeout: float) -> Timeout:
+    provider = model.split("/", 1)[0] if "/" in model else "unknown"
+    return Timeout(message=f"LLM call to {model} exceeded {timeout}s", model=model, llm_provider=provider)
+
+
+async def acomplete(model: str, messages: List[Dict], timeout: float = None, **kwargs):
+    """Run one chat completion through the gateway.
+
+    Waits for a free slot under the model's concurrency limit, then awaits
+    `litellm.acompletion` with a hard timeout. Provider errors propagate
+    unchanged; a timeout is raised as `litellm.Timeout` so it is part of
+    BUSY_ERRORS.
+    """
+    timeout = timeout or model_limits(model)["timeout"]
+    semaphore = _semaphore_for(model)
+    stats = _stats_for(model)
+
+    stats["waiting"] += 1
+    try:
+        await semaphore.acquire()
+    finally:
+        stats["waiting"] -= 1
+
+    stats["in_flight"] += 1
+    try:
+        response = await asyncio.wait_for(
+            acompletion(model=model, messages=messages, timeout=timeout, **kwargs),
+            timeout=timeout,
+        )
+    except asyncio.TimeoutError:
+        stats["timeouts"] += 1
+        raise _timeout_error(model, timeout)
+    except Exception:
+        stats["failed"] += 1
+        raise
+    finally:
+        stats["in_flight"] -= 1
+        semaphore.release()
+    stats["completed"] += 1
+    return response
+
+
+async def acomplete_text(model: str, messages: List[Dict], timeout: float = None, **kwargs) -> str:
+    """Like `acomplete`, but return only the first choice's message content."""
+    response = await acomplete(model, messages, timeout=timeout, **kwargs)
+    return response["choices"][0]["message"]["content"]
+
+
+async def astream(model: str, messages: List[Dict], timeout: float = None, **kwargs) -> AsyncGenerator[str, None]:
+    """Stream a chat completion through the gateway, yielding content deltas.
+
+    The model's concurrency slot is held until the stream is exhausted or
+    closed. `timeout` bounds the wait for the first token and every gap
+    between tokens, so a stalled stream fails instead of hanging.
+    """
+    timeout = timeout or model_limits(model)["timeout"]
+    semaphore = _semaphore_for(model)
+    stats = _stats_for(model)
+
+    stats["waiting"] += 1
+    try:
+        await semaphore.acquire()
+    finally:
+        stats["waiting"] -= 1
+
+    stats["in_flight"] += 1
+    try:
+        response = await asyncio.wait_for(
+            acompletion(model=model, messages=messages, stream=True, timeout=timeout, **kwargs),
+            timeout=timeout,
+        )
+        chunks = response.__aiter__()
+        while True:
+            try:
+                chunk = await asyncio.wait_for(chunks.__anext__(), timeout=timeout)
+            except StopAsyncIteration:
+                break
+            delta = chunk.choices[0].delta.content if chunk.choices else None
+            if delta:
+                yield delta
+    except asyncio.TimeoutError:
+        stats["timeouts"] += 1
+        raise _timeout_error(model, timeout)
+    except Exception:
+        stats["failed"] += 1
+        raise
+    else:
+        stats["completed"] += 1
+    finally:
+        stats["in_flight"] -= 1
+        semaphore.release()
+
+
+def gateway_stats() -> Dict[str, Dict]:
+    """Snapshot of per-model queue depth, in-flight calls and outcomes."""
+    return {
+        model: dict(stats, **model_limits(model))
+        for model, stats in _stats.items()
+    }
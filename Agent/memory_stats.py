@@ -0,0 +1,33 @@
+import os
+import resource
+import sys
+from typing import Dict
+
+
+def process_memory(pid: int = None) -> Dict[str, float]:
+    """Resident memory of this process (or `pid`) in MB.
+
+    On Linux, `pss_mb` (proportional set size) splits pages shared with other
+    processes between them, and `shared_mb` is the part not private to this
+    process; elsewhere only the peak RSS of this process is available.
+    """
+    stats = {}
+    try:
+        with open(f"/proc/{pid or os.getpid()}/smaps_rollup") as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) >= 2 and parts[0] in ("Rss:", "Pss:", "Shared_Clean:", "Shared_Dirty:"):
+                    stats[parts[0][:-1]] = int(parts[1]) / 1024
+    except OSError:
+        pass
+    if "Rss" not in stats:
+        if pid is not None and pid != os.getpid():
+            return {}
+        # ru_maxrss is KB on Linux, bytes on macOS
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return {"peak_rss_mb": round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)}
+    return {
+        "rss_mb": round(stats["Rss"], 1),
+        "pss_mb": round(stats.get("Pss", stats["Rss"]), 1),
+        "shared_mb": round(stats.get("Shared_Clean", 0) + stats.get("Shared_Dirty", 0), 1),
+    }
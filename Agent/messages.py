@@ -0,0 +1,90 @@
+import hashlib
+import sys
+from typing import Dict, Iterable, Optional
+
+# Assistant replies at least this long (checklists, policies, long RAG answers)
+# are kept once in the session's payload store and referenced by hash
+PAYLOAD_MIN_CHARS = 1024
+
+
+class Message:
+    """One chat history entry.
+
+    Policy answers refer to their question by `question_index` (title and
+    category come from `questions[question_index]`) and to their embedding
+    by `embedding_row`; `compliant` is None for anything that is not a
+    validated answer. Long content lives in the session's PayloadStore and
+    the message only keeps its `payload` key.
+    """
+
+    __slots__ = ("role", "content", "payload", "question_index", "compliant", "embedding_row")
+
+    def __init__(self, role: str, content: Optional[str] = None, payload: Optional[str] = None,
+                 question_index: Optional[int] = None, compliant: Optional[bool] = None,
+                 embedding_row: Optional[int] = None):
+        self.role = role
+        self.content = content
+        self.payload = payload
+        self.question_index = question_index
+        self.compliant = compliant
+        self.embedding_row = embedding_row
+
+    def to_dict(self) -> Dict:
+        """JSON-safe form; unset fields are left out."""
+        return {name: getattr(self, name) for name in self.__slots__ if getattr(self, name) is not None}
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "Message":
+        compliant = data.get("compliant")
+        if compliant is None and "compliance" in data:
+            # History saved as plain dicts, before messages were typed
+            compliant = data["compliance"] != "Non-compliant"
+        return cls(data["role"], data.get("content"), data.get("payload"), data.get("question_index"),
+                   compliant, data.get("embedding_row"))
+
+    def approx_bytes(self) -> int:
+        return sys.getsizeof(self) + sum(sys.getsizeof(value) for value in self.to_dict().values())
+
+    def __repr__(self) -> str:
+        fields = ", ".join(f"{name}={value!r}" for name, value in self.to_dict().items())
+        return f"Message({fields})"
+
+
+class PayloadStore:
+    """Content-addressed side store for long message contents.
+
+    Identical payloads (e.g. the same cached answer given twice) are stored
+    once. Entries no message refers to any more are dropped by `retain()`.
+    """
+
+    def __init__(self, payloads: Dict[str, str] = None):
+        self._payloads: Dict[str, str] = dict(payloads or {})
+
+    def __len__(self) -> int:
+        return len(self._payloads)
+
+    @staticmethod
+    def key(text: str) -> str:
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+
+    def put(self, text: str) -> str:
+        key = self.key(text)
+        self._payloads.setdefault(key, text)
+        return key
+
+    def get(self, key: str) -> Optional[str]:
+        return self._payloads.get(key)
+
+    def retain(self, keys: Iterable[str]):
+        keep = set(keys)
+        for key in [key for key in self._payloads if key not in keep]:
+            del self._payloads[key]
+
+    def clear(self):
+        self._payloads.clear()
+
+    def to_dict(self) -> Dict[str, str]:
+        return dict(self._payloads)
+
+    def approx_bytes(self) -> int:
+        return sys.getsizeof(self._payloads) + sum(sys.getsizeof(text) for text in self._payloads.values())
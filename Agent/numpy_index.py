@@ -0,0 +1,69 @@
+from typing import Any, Dict, List, Tuple
+import numpy as np
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document as LangChainDocument
+from langchain_core.retrievers import BaseRetriever
+
+
+class NumpyIndex:
+    """Exact in-memory vector index for small corpora.
+
+    All chunk embeddings live in one L2-normalized float32 matrix, so a
+    query is a single matrix-vector product followed by `argpartition` for
+    the top k. For a few dozen chunks this is far cheaper than going through
+    Chroma's SQLite and HNSW layers, and the results are exact.
+    """
+
+    def __init__(self, vectors, texts: List[str], metadatas: List[Dict], ids: List[str] = None):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if vectors.ndim != 2 or len(vectors) != len(texts):
+            raise ValueError(f"Expected one vector per text, got {vectors.shape} for {len(texts)} texts")
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        self.vectors = np.ascontiguousarray(vectors / np.where(norms == 0, 1, norms))
+        self.vectors.setflags(write=False)
+        self.texts = list(texts)
+        self.metadatas = [dict(metadata or {}) for metadata in metadatas]
+        self.ids = list(ids) if ids is not None else [str(i) for i in range(len(texts))]
+
+    @classmethod
+    def from_collection(cls, collection) -> "NumpyIndex":
+        """Load every chunk of a Chroma collection, e.g. right after it has been synced."""
+        data = collection.get(include=["embeddings", "documents", "metadatas"])
+        return cls(data["embeddings"], data["documents"], data["metadatas"], data["ids"])
+
+    def __len__(self) -> int:
+        return len(self.texts)
+
+    def search(self, query_vector, k: int = 4) -> List[Tuple[int, float]]:
+        """Return (row, cosine score) pairs for the k most similar chunks, best first."""
+        if len(self) == 0 or k <= 0:
+            return []
+        query = np.asarray(query_vector, dtype=np.float32).reshape(-1)
+        norm = np.linalg.norm(query)
+        scores = self.vectors @ (query / norm if norm else query)
+        if k < len(scores):
+            top = np.argpartition(-scores, k - 1)[:k]
+        else:
+            top = np.arange(len(scores))
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [(int(row), float(scores[row])) for row in top]
+
+
+class NumpyRetriever(BaseRetriever):
+    """LangChain retriever over a NumpyIndex.
+
+    Drop-in replacement for `vector_store.as_retriever(search_kwargs={"k": k})`:
+    queries are embedded through the shared EmbeddingService (and its cache)
+    and matched against the in-memory index.
+    """
+
+    index: Any
+    embedder: Any
+    search_kwargs: Dict = {"k": 4}
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[LangChainDocument]:
+        hits = self.index.search(self.embedder.encode(query), self.search_kwargs.get("k", 4))
+        return [
+            LangChainDocument(id=self.index.ids[row], page_content=self.index.texts[row], metadata=dict(self.index.metadatas[row]))
+            for row, _ in hits
+        ]
@@ -0,0 +1,175 @@
+import asyncio
+import logging
+import re
+import time
+from typing import AsyncGenerator, AsyncIterator, Dict, List
+import settings
+
+logger = logging.getLogger(__name__)
+
+PACING_MODES = ("instant", "fixed_rate", "time_budget")
+CHUNK_UNITS = ("tokens", "bytes")
+
+# A token is a run of non-whitespace plus the whitespace that follows it, so
+# joining the chunks reproduces the original text (newlines included).
+_TOKEN_RE = re.compile(r"\s*\S+\s*|\s+")
+
+
+def chunk_text(text: str, unit: str = None, size: int = None) -> List[str]:
+    """Split text into chunks of `size` tokens or `size` UTF-8 bytes."""
+    unit = unit or settings.PACING_CHUNK_UNIT
+    size = max(1, size or settings.PACING_CHUNK_SIZE)
+    if not text:
+        return []
+    if unit == "tokens":
+        tokens = _TOKEN_RE.findall(text)
+        return ["".join(tokens[i:i + size]) for i in range(0, len(tokens), size)]
+    if unit == "bytes":
+        chunks = []
+        current = []
+        current_bytes = 0
+        for char in text:
+            char_bytes = len(char.encode("utf-8"))
+            if current and current_bytes + char_bytes > size:
+                chunks.append("".join(current))
+                current, current_bytes = [], 0
+            current.append(char)
+            current_bytes += char_bytes
+        if current:
+            chunks.append("".join(current))
+        return chunks
+    raise ValueError(f"Unknown chunk unit '{unit}'; expected one of {CHUNK_UNITS}")
+
+
+def chunk_delay(mode: str, chunk_count: int) -> float:
+    """Seconds to sleep between chunks for the given pacing mode."""
+    if mode == "instant" or chunk_count <= 1:
+        return 0.0
+    interval = settings.PACING_INTERVAL_MS / 1000
+    if mode == "fixed_rate":
+        return interval
+    if mode == "time_budget":
+        budget = settings.PACING_MAX_DURATION_MS / 1000
+        return min(interval, budget / (chunk_count - 1))
+    raise ValueError(f"Unknown pacing mode '{mode}'; expected one of {PACING_MODES}")
+
+
+class ConnectionStats:
+    """Aggregate of how long streamed responses keep their connection open."""
+
+    def __init__(self):
+        self.active = 0
+        self.completed = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        self.by_mode: Dict[str, Dict] = {}
+
+    def opened(self):
+        self.active += 1
+
+    def closed(self, mode: str, seconds: float):
+        self.active -= 1
+        self.completed += 1
+        self.total_seconds += seconds
+        self.max_seconds = max(self.max_seconds, seconds)
+        mode_stats = self.by_mode.setdefault(mode, {"completed": 0, "total_seconds": 0.0})
+        mode_stats["completed"] += 1
+        mode_stats["total_seconds"] += seconds
+
+    def snapshot(self) -> Dict:
+        return {
+            "active": self.active,
+            "completed": self.completed,
+            "avg_held_seconds": round(self.total_seconds / self.completed, 4) if self.completed else 0.0,
+            "max_held_seconds": round(self.max_seconds, 4),
+            "by_mode": {
+                mode: {
+                    "completed": stats["completed"],
+                    "avg_held_seconds": round(stats["total_seconds"] / stats["completed"], 4),
+                }
+                for mode, stats in self.by_mode.items()
+            },
+        }
+
+
+connection_stats = ConnectionStats()
+
+
+async def track_connection(stream: AsyncIterator, mode: str = "passthrough") -> AsyncGenerator:
+    """Wrap a response stream and record how long it holds the connection."""
+    start = time.monotonic()
+    connection_stats.opened()
+    try:
+        async for chunk in stream:
+            yield chunk
+    finally:
+        # Close the wrapped stream now so its own cleanup runs before we report
+        if hasattr(stream, "aclose"):
+            await stream.aclose()
+        held = time.monotonic() - start
+        connection_stats.closed(mode, held)
+        logger.debug("Connection held %.3fs (%s)", held, mode)
+
+
+async def paced_stream(text: str, trailer: str = "", mode: str = None, unit: str = None, size: int = None) -> AsyncGenerator[str, None]:
+    """Yield `text` in chunks paced according to `mode`, then `trailer`.
+
+    The trailer (e.g. the [VALID_ANSWER] block) is always sent in one piece
+    after the last chunk, so the client protocol is unchanged.
+    """
+    mode = mode or settings.PACING_MODE
+    # Nothing to pace: send the whole body in one write
+    if mode == "instant" and not (unit or size):
+        chunks = [text] if text else []
+    else:
+        chunks = chunk_text(text, unit, size)
+    delay = chunk_delay(mode, len(chunks))
+
+    async def _chunks():
+        for i, chunk in enumerate(chunks):
+            if i and delay:
+                await asyncio.sleep(delay)
+            yield chunk
+        if trailer:
+            yield trailer
+
+    async for chunk in track_connection(_chunks(), mode):
+        yield chunk
+
+
+def _boundary_prefix_length(text: str, boundary: str) -> int:
+    """Length of the longest tail of `text` that is a proper prefix of `boundary`."""
+    for length in range(min(len(boundary) - 1, len(text)), 0, -1):
+        if text.endswith(boundary[:length]):
+            return length
+    return 0
+
+
+async def flush_on_boundary(stream: AsyncIterator[str], boundary: str = "\n## ", max_delay_ms: float = None) -> AsyncGenerator[str, None]:
+    """Re-chunk a token stream so every chunk starts at a `boundary`.
+
+    Text before the last boundary seen is flushed immediately. Tokens never
+    wait longer than `max_delay_ms` for a boundary, so a long section still
+    streams and the connection never looks idle.
+    """
+    max_delay = (max_delay_ms or 0) / 1000
+    buffer = ""
+    last_flush = time.monotonic()
+    async for token in stream:
+        buffer += token
+        cut = buffer.rfind(boundary)
+        now = time.monotonic()
+        if cut > 0:
+            yield buffer[:cut]
+            buffer = buffer[cut:]
+            last_flush = now
+        elif buffer and now - last_flush >= max_delay:
+            # Keep back a possible start of the boundary (e.g. a trailing "\n#")
+            # so the timed flush never splits it across chunks
+            held = _boundary_prefix_length(buffer, boundary)
+            if held < len(buffer):
+                yield buffer[:len(buffer) - held]
+                buffer = buffer[len(buffer) - held:]
+                last_flush = now
+    if buffer:
+        yield buffer
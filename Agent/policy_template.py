@@ -0,0 +1,190 @@
+import asyncio
+import logging
+import os
+import re
+from typing import Dict, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+ORGANIZATION_PLACEHOLDER = "[Organization Name]"
+SECTION_SEPARATOR = "\n\n---\n\n"
+
+_SUBCATEGORY_RE = re.compile(r"^\*\*NIST AI RMF Sub-Categor(?:y|ies):\*\*\s*(.+)$", re.MULTILINE)
+_CITATION_PART_RE = re.compile(r"^(.*\S)\s+(\d+(?:\.\d+)*)$")
+_NUMBER_RE = re.compile(r"^\d+(?:\.\d+)*$")
+
+
+def parse_citation(citation: str) -> Set[str]:
+    """Expand a citation such as 'GOVERN 1.1, 1.2' into {'GOVERN 1.1', 'GOVERN 1.2'}.
+
+    Bare numbers inherit the function name of the previous part; parts that
+    are not numbered (e.g. 'RAI Template IV.I') are kept as-is.
+    """
+    ids = set()
+    function = None
+    for part in citation.split(","):
+        part = " ".join(part.split())
+        if not part:
+            continue
+        if _NUMBER_RE.match(part) and function:
+            ids.add(f"{function} {part}")
+            continue
+        match = _CITATION_PART_RE.match(part)
+        if match:
+            function = match.group(1).upper()
+            ids.add(f"{function} {match.group(2)}")
+        else:
+            function = None
+            ids.add(part)
+    return ids
+
+
+def split_sections(template: str) -> Dict:
+    """Split the policy template into its preamble and '## ' sections.
+
+    Returns {"preamble": str, "sections": [...]} where each section has its
+    heading line, its text (without the trailing '---' rule) and the set of
+    NIST sub-categories it covers. Sections are kept in template order.
+    """
+    lines = template.splitlines()
+    preamble: List[str] = []
+    sections: List[Dict] = []
+    current: List[str] = None
+    for line in lines:
+        if line.startswith("## "):
+            if current is not None:
+                sections.append(_make_section(current))
+            current = [line]
+        elif current is None:
+            preamble.append(line)
+        else:
+            current.append(line)
+    if current is not None:
+        sections.append(_make_section(current))
+    return {"preamble": "\n".join(preamble).strip(), "sections": sections}
+
+
+def _make_section(lines: List[str]) -> Dict:
+    text = "\n".join(lines).strip()
+    if text.endswith("---"):
+        text = text[:-3].rstrip()
+    match = _SUBCATEGORY_RE.search(text)
+    return {
+        "heading": lines[0].strip(),
+        "text": text,
+        "subcategories": parse_citation(match.group(1)) if match else set(),
+    }
+
+
+def fill_organization(text: str, organization_name: str = None) -> str:
+    return text.replace(ORGANIZATION_PLACEHOLDER, organization_name) if organization_name else text
+
+
+class PolicyTemplate:
+    """A parsed policy template.
+
+    Holds the raw text (for the single-prompt modes), the preamble and
+    sections in template order, and `by_subcategory`, which maps each NIST
+    sub-category (e.g. 'GOVERN 1.1') to the sections that cover it.
+    """
+
+    def __init__(self, text: str):
+        parsed = split_sections(text)
+        if not parsed["sections"]:
+            raise ValueError("Policy template has no '## ' sections")
+        self.text = text
+        self.preamble = parsed["preamble"]
+        self.sections = parsed["sections"]
+        self.by_subcategory: Dict[str, List[Dict]] = {}
+        for section in self.sections:
+            for subcategory in section["subcategories"]:
+                self.by_subcategory.setdefault(subcategory, []).append(section)
+
+    def rows_by_section(self, rows: List[Dict]) -> List[List[Dict]]:
+        """The checklist rows for each section, in template order.
+
+        Rows whose 'Citation' names exactly the section's sub-categories win;
+        otherwise every row sharing a sub-category with the section is used.
+        Each row's citation is parsed once and only looked up in the sections
+        covering one of its sub-categories.
+        """
+        candidates: Dict[int, List[Tuple[Dict, Set[str]]]] = {}
+        for row in rows:
+            ids = parse_citation(row["Citation"])
+            seen = set()
+            for subcategory in ids:
+                for section in self.by_subcategory.get(subcategory, ()):
+                    if id(section) not in seen:
+                        seen.add(id(section))
+                        candidates.setdefault(id(section), []).append((row, ids))
+        result = []
+        for section in self.sections:
+            # Rows were appended in checklist order
+            cited = candidates.get(id(section), [])
+            exact = [row for row, ids in cited if ids == section["subcategories"]]
+            result.append(exact or [row for row, _ in cited])
+        return result
+
+
+class TemplateRegistry:
+    """The current PolicyTemplate of a file, reloaded when the file changes.
+
+    `load()` reads and parses the file and raises if it is missing or has
+    no sections, so a broken deployment fails at startup. After that,
+    `watch()` polls the file's mtime in the background; a changed file is
+    parsed in full before it replaces `current` in one assignment, so a
+    request always sees either the old or the new template. A reload that
+    fails keeps the previous template.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.current: Optional[PolicyTemplate] = None
+        self.reloads = 0
+        self.reload_errors = 0
+        self._signature: Optional[Tuple[int, int]] = None
+        self._failed_signature: Optional[Tuple[int, int]] = None
+
+    def _stat(self) -> Tuple[int, int]:
+        stat = os.stat(self.path)
+        return stat.st_mtime_ns, stat.st_size
+
+    def load(self) -> PolicyTemplate:
+        signature = self._stat()
+        with open(self.path, "r", encoding="utf-8") as f:
+            template = PolicyTemplate(f.read())
+        self.current, self._signature = template, signature
+        logger.info("Loaded policy template %s (%d sections)", self.path, len(template.sections))
+        return template
+
+    def check(self) -> bool:
+        """Reload if the file changed since the last load; True if a new template was swapped in."""
+        try:
+            signature = self._stat()
+        except OSError:
+            signature = None
+        if signature == self._signature or (signature == self._failed_signature and self.reload_errors):
+            return False
+        try:
+            self.load()
+        except Exception:
+            # Report each broken version of the file (or its absence) once, not on every poll
+            self.reload_errors += 1
+            self._failed_signature = signature
+            logger.exception("Reloading policy template %s failed; keeping the previous version", self.path)
+            return False
+        self.reloads += 1
+        return True
+
+    async def watch(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            await asyncio.to_thread(self.check)
+
+    def stats(self) -> Dict:
+        return {
+            "path": self.path,
+            "sections": len(self.current.sections) if self.current is not None else 0,
+            "reloads": self.reloads,
+            "reload_errors": self.reload_errors,
+        }
@@ -0,0 +1,109 @@
+import asyncio
+import logging
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class RenderQueueFull(Exception):
+    """Raised when every worker is busy and the wait queue is at its limit."""
+
+    def __init__(self, retry_after: int):
+        super().__init__("Document render queue is full")
+        self.retry_after = retry_after
+
+
+def _render(kind: str, markdown_content: str, logo_path: str = None) -> Tuple[bytes, float]:
+    """Worker-side entry point: render a document and time the render itself."""
+    # Imported in the worker so the parent never pays for PyMuPDF/PIL here
+    from policy_doc import generate_docx, generate_pdf
+
+    renderers = {"pdf": generate_pdf, "docx": generate_docx}
+    start = time.perf_counter()
+    buffer = renderers[kind](markdown_content, logo_path)
+    return buffer.getvalue(), time.perf_counter() - start
+
+
+class RenderPool:
+    """Bounded process pool for CPU-heavy PDF/DOCX rendering.
+
+    At most `max_workers` documents render at once and at most `max_queue`
+    more may wait; beyond that `render` raises RenderQueueFull so the caller
+    can answer 503 with Retry-After instead of piling work onto the server.
+    Workers are spawned (not forked) so they never inherit the torch/model
+    state of the API process. A spawned worker does re-import the parent's
+    `__main__` module, which is why the API is started with `uvicorn api:app`
+    or `python serve.py` and never with api.py as `__main__`.
+    """
+
+    def __init__(self, max_workers: int = 2, max_queue: int = 8, retry_after: int = 10):
+        self.max_workers = max(1, max_workers)
+        self.max_queue = max(0, max_queue)
+        self.retry_after = retry_after
+        self._executor: ProcessPoolExecutor = None
+        self._pending = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.total_wait = 0.0
+        self.total_render = 0.0
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return self._executor
+
+    async def render(self, kind: str, markdown_content: str, logo_path: str = None) -> Tuple[bytes, Dict[str, float]]:
+        """Render `kind` ("pdf" or "docx") and return (content, timings in ms)."""
+        if self._pending >= self.max_workers + self.max_queue:
+            self.rejected += 1
+            raise RenderQueueFull(self.retry_after)
+        self._pending += 1
+        submitted = time.perf_counter()
+        try:
+            loop = asyncio.get_running_loop()
+            content, render_seconds = await loop.run_in_executor(
+                self._get_executor(), _render, kind, markdown_content, logo_path
+            )
+        except BrokenProcessPool:
+            # A worker died (e.g. OOM); start a fresh pool for the next job
+            self._executor = None
+            self.failed += 1
+            raise
+        except Exception:
+            self.failed += 1
+            raise
+        finally:
+            self._pending -= 1
+        # Everything that was not rendering was queueing (plus IPC)
+        wait_seconds = max(0.0, time.perf_counter() - submitted - render_seconds)
+        self.completed += 1
+        self.total_wait += wait_seconds
+        self.total_render += render_seconds
+        logger.info("Rendered %s in %.0f ms after %.0f ms in queue", kind, render_seconds * 1000, wait_seconds * 1000)
+        return content, {"queue_wait_ms": wait_seconds * 1000, "render_ms": render_seconds * 1000}
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def stats(self) -> Dict:
+        return {
+            "max_workers": self.max_workers,
+            "max_queue": self.max_queue,
+            "in_flight": min(self._pending, self.max_workers),
+            "queued": max(0, self._pending - self.max_workers),
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "avg_queue_wait_ms": round(self.total_wait / self.completed * 1000, 1) if self.completed else 0.0,
+            "avg_render_ms": round(self.total_render / self.completed * 1000, 1) if self.completed else 0.0,
+        }
@@ -0,0 +1,122 @@
+import hashlib
+import os
+import time
+from typing import Dict, List, Optional
+import numpy as np
+
+
+class SemanticCache:
+    """Fixed-size vector index of past questions and their answers.
+
+    Question embeddings are kept L2-normalized in one float32 matrix, so a
+    lookup is a single matrix-vector product. When full, the least recently
+    used entry is overwritten. The cache empties itself whenever its
+    fingerprint (the watched source files plus any extra text such as the
+    system prompt and model) changes.
+    """
+
+    def __init__(self, threshold: float = 0.95, max_entries: int = 1024, watched_files: List[str] = None,
+                 fingerprint_extra: str = "", enabled: bool = True):
+        self.enabled = enabled
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.watched_files = watched_files or []
+        self.fingerprint_extra = fingerprint_extra
+        self._vectors: Optional[np.ndarray] = None
+        self._questions: List[str] = []
+        self._answers: List[str] = []
+        self._last_used = np.zeros(max_entries, dtype=np.float64)
+        self._size = 0
+        self._mtimes = self._stat_files()
+        self._fingerprint = self._compute_fingerprint()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def _stat_files(self) -> tuple:
+        return tuple(os.stat(path).st_mtime_ns if os.path.exists(path) else None for path in self.watched_files)
+
+    def _compute_fingerprint(self) -> str:
+        digest = hashlib.sha256(self.fingerprint_extra.encode("utf-8"))
+        for path in self.watched_files:
+            if os.path.exists(path):
+                with open(path, "rb") as f:
+                    digest.update(f.read())
+        return digest.hexdigest()
+
+    def _check_fresh(self):
+        # Cheap stat on every lookup; the files are only re-hashed when an mtime moves
+        mtimes = self._stat_files()
+        if mtimes == self._mtimes:
+            return
+        self._mtimes = mtimes
+        fingerprint = self._compute_fingerprint()
+        if fingerprint != self._fingerprint:
+            self._fingerprint = fingerprint
+            self.clear()
+            self.invalidations += 1
+
+    def clear(self):
+        self._vectors = None
+        self._questions = []
+        self._answers = []
+        self._last_used[:] = 0
+        self._size = 0
+
+    @staticmethod
+    def _normalize(vector) -> np.ndarray:
+        vector = np.asarray(vector, dtype=np.float32).reshape(-1)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def lookup(self, vector) -> Optional[str]:
+        """Return the cached answer for the most similar question above the threshold."""
+        if not self.enabled:
+            return None
+        self._check_fresh()
+        if self._size == 0:
+            self.misses += 1
+            return None
+        scores = self._vectors[:self._size] @ self._normalize(vector)
+        best = int(np.argmax(scores))
+        if scores[best] < self.threshold:
+            self.misses += 1
+            return None
+        self._last_used[best] = time.monotonic()
+        self.hits += 1
+        return self._answers[best]
+
+    def store(self, question: str, vector, answer: str):
+        if not self.enabled or self.max_entries <= 0:
+            return
+        self._check_fresh()
+        vector = self._normalize(vector)
+        if self._vectors is None:
+            self._vectors = np.zeros((self.max_entries, vector.shape[0]), dtype=np.float32)
+        if self._size < self.max_entries:
+            row = self._size
+            self._size += 1
+            self._questions.append(question)
+            self._answers.append(answer)
+        else:
+            row = int(np.argmin(self._last_used[:self._size]))
+            self._questions[row] = question
+            self._answers[row] = answer
+            self.evictions += 1
+        self._vectors[row] = vector
+        self._last_used[row] = time.monotonic()
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "entries": self._size,
+            "max_entries": self.max_entries,
+            "threshold": self.threshold,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
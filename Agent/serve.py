@@ -0,0 +1,171 @@
+"""Pre-fork multi-worker server for the API.
+
+The master process imports the app, runs the whole warmup once (knowledge
+base, embedding model, Chroma sync, in-memory retrieval index), closes Chroma
+and freezes the heap, then forks the workers. They inherit the model weights
+and the index copy-on-write, so N workers cost little more than one, and
+only the master ever writes to Chroma's SQLite files. Workers share one
+listening socket; crashed workers are replaced, and the master logs a
+per-worker memory report (RSS / PSS / shared) periodically.
+
+Sessions must live in a shared store (sessions.backend sqlite or redis)
+when running more than one worker.
+
+Usage:
+    python serve.py
+    python serve.py --workers 4 --port 8000
+"""
+import argparse
+import asyncio
+import gc
+import logging
+import os
+import signal
+import socket
+import sys
+import time
+import settings
+from memory_stats import process_memory
+
+logger = logging.getLogger("serve")
+
+
+def limit_torch_threads(threads: int):
+    try:
+        import torch
+    except ImportError:
+        return
+    torch.set_num_threads(threads)
+
+
+def bind_socket(host: str, port: int) -> socket.socket:
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+
+def run_worker(sock: socket.socket, api, reload_model: bool, threads: int, log_level: str):
+    import uvicorn
+
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(sig, signal.SIG_DFL)
+    limit_torch_threads(threads)
+    # SQLite connections and Redis pools must not be shared across a fork
+    api.validation_cache = api.create_validation_cache()
+    api.session_store = api.create_sessions()
+    if reload_model:
+        # ONNX Runtime sessions are not fork-safe; load the model again in each worker
+        api.load_embeddings()
+        api.generic_retriever.embedder = api.embedding_service
+    logger.info("Worker %d serving (memory: %s)", os.getpid(), process_memory())
+    server = uvicorn.Server(uvicorn.Config(api.app, log_level=log_level.lower(), lifespan="on"))
+    server.run(sockets=[sock])
+
+
+def spawn(sock: socket.socket, api, reload_model: bool, threads: int, log_level: str) -> int:
+    pid = os.fork()
+    if pid == 0:
+        code = 0
+        try:
+            run_worker(sock, api, reload_model, threads, log_level)
+        except Exception:
+            logger.exception("Worker %d crashed", os.getpid())
+            code = 1
+        finally:
+            os._exit(code)
+    return pid
+
+
+def memory_report(workers) -> str:
+    lines = [f"{'pid':>8} {'role':<7} {'rss MB':>8} {'pss MB':>8} {'shared MB':>10}"]
+    rows = [(os.getpid(), "master")] + [(pid, "worker") for pid in sorted(workers)]
+    total_pss = 0.0
+    for pid, role in rows:
+        memory = process_memory(pid)
+        total_pss += memory.get("pss_mb", 0.0)
+        lines.append(
+            f"{pid:>8} {role:<7} {memory.get('rss_mb', 0.0):>8.1f} {memory.get('pss_mb', 0.0):>8.1f} "
+            f"{memory.get('shared_mb', 0.0):>10.1f}"
+        )
+    # Master included: it holds the pages the workers share
+    lines.append(f"total PSS {total_pss:.1f} MB, {total_pss / max(1, len(workers)):.1f} MB per worker")
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default=settings.SERVER_HOST)
+    parser.add_argument("--port", type=int, default=settings.SERVER_PORT)
+    parser.add_argument("--workers", type=int, default=settings.SERVER_WORKERS)
+    parser.add_argument("--threads-per-worker", type=int, default=settings.SERVER_THREADS_PER_WORKER)
+    args = parser.parse_args()
+    logging.basicConfig(level=settings.LOG_LEVEL, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    if args.workers > 1 and settings.SESSION_BACKEND == "memory":
+        sys.exit("serve.py: more than one worker needs a shared session store; set sessions.backend to 'sqlite' or 'redis'")
+
+    # Workers never query Chroma; the master builds the in-memory index for them
+    settings.RETRIEVAL_BACKEND = "numpy"
+    # Keep torch from starting its thread pool before the fork; workers pick their own count
+    limit_torch_threads(1)
+
+    import api
+
+    start = time.perf_counter()
+    asyncio.run(api.warmup.run())
+    if not api.warmup.ready:
+        sys.exit(f"serve.py: warmup failed in stage '{api.warmup.failed_stage}': {api.warmup.error}")
+    api.close_vector_stores()
+    reload_model = settings.EMBEDDING_BACKEND != "torch"
+    logger.info("Master %d warmed up in %.2fs (memory: %s)", os.getpid(), time.perf_counter() - start, process_memory())
+
+    # Objects created so far are never freed; keep the collector from touching
+    # (and so un-sharing) their pages in the workers
+    gc.collect()
+    gc.freeze()
+
+    sock = bind_socket(args.host, args.port)
+    workers = {}
+    for _ in range(args.workers):
+        workers[spawn(sock, api, reload_model, args.threads_per_worker, settings.LOG_LEVEL)] = time.monotonic()
+    logger.info("Listening on %s:%d with %d workers", args.host, args.port, args.workers)
+
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(workers):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    next_report = time.monotonic() + settings.SERVER_MEMORY_REPORT_INTERVAL_SECONDS
+    while workers:
+        pid, status = os.waitpid(-1, os.WNOHANG)
+        if pid == 0:
+            time.sleep(0.5)
+            if not stopping and time.monotonic() >= next_report:
+                logger.info("Memory per process:\n%s", memory_report(workers))
+                next_report = time.monotonic() + settings.SERVER_MEMORY_REPORT_INTERVAL_SECONDS
+            continue
+        started = workers.pop(pid, None)
+        if started is None or stopping:
+            continue
+        logger.warning("Worker %d exited with status %d; starting a replacement", pid, os.waitstatus_to_exitcode(status))
+        # Back off if workers die right after starting, e.g. a port or config problem
+        if time.monotonic() - started < 5:
+            time.sleep(5)
+        workers[spawn(sock, api, reload_model, args.threads_per_worker, settings.LOG_LEVEL)] = time.monotonic()
+    logger.info("All workers stopped")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,625 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import sys
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, List, Optional
+from answer_matrix import AnswerMatrix
+from checklist import Checklist
+from messages import PAYLOAD_MIN_CHARS, Message, PayloadStore
+
+logger = logging.getLogger(__name__)
+
+SESSION_BACKENDS = ("memory", "sqlite", "redis")
+
+
+class SessionBusy(Exception):
+    """Raised when another request holds a session's lock for longer than the wait timeout."""
+
+
+class SessionLeaseLost(SessionBusy):
+    """Raised instead of saving when the session's lease was taken over during the update."""
+
+
+class Session:
+    """All conversation state of one user.
+
+    `mode` is "generic" or "policy"; `question_index` is the policy question
+    being asked; `conversation_state` tracks the post-questionnaire steps
+    (e.g. "awaiting_policy_decision"); `answers` holds the embeddings of the
+    policy answers, which user messages in `history` refer to by row;
+    `checklist` collects the validated answers per question. `history` is a
+    list of Message records whose long contents sit in `payloads`.
+    """
+
+    def __init__(self, user_id: str, mode: str = "generic", history: List[Message] = None, question_index: int = 0,
+                 conversation_state: Optional[str] = None, answers: Optional[AnswerMatrix] = None,
+                 checklist: Optional[Checklist] = None, payloads: Optional[PayloadStore] = None):
+        self.user_id = user_id
+        self.mode = mode
+        self.history = history if history is not None else []
+        self.question_index = question_index
+        self.conversation_state = conversation_state
+        self.answers = answers
+        self.checklist = checklist if checklist is not None else Checklist()
+        self.payloads = payloads if payloads is not None else PayloadStore()
+
+    def add_message(self, role: str, content: str, question_index: int = None, compliant: bool = None,
+                    embedding_row: int = None) -> Message:
+        """Append to the history, moving long assistant replies into the payload store."""
+        message = Message(role, question_index=question_index, compliant=compliant, embedding_row=embedding_row)
+        if role == "assistant" and len(content) >= PAYLOAD_MIN_CHARS:
+            message.payload = self.payloads.put(content)
+        else:
+            message.content = content
+        self.history.append(message)
+        return message
+
+    def text(self, message: Message) -> str:
+        """A message's content, read back from the payload store if it was moved there."""
+        if message.payload is not None:
+            return self.payloads.get(message.payload) or ""
+        return message.content
+
+    def clear_history(self):
+        self.history = []
+        self.payloads.clear()
+
+    def trim_generic_turns(self, max_turns: int):
+        """Keep only the last `max_turns` generic-mode exchanges (a question and its replies).
+
+        Policy-mode messages always come first in the history, since
+        starting the questionnaire clears it, so they are never trimmed.
+        """
+        if max_turns <= 0:
+            return
+        starts = [i for i, message in enumerate(self.history) if message.role == "user" and message.question_index is None]
+        if len(starts) <= max_turns:
+            return
+        del self.history[starts[0]:starts[len(starts) - max_turns]]
+        self.payloads.retain(message.payload for message in self.history if message.payload is not None)
+
+    def to_dict(self) -> Dict:
+        return {
+            "user_id": self.user_id,
+            "mode": self.mode,
+            "history": [message.to_dict() for message in self.history],
+            "payloads": self.payloads.to_dict(),
+            "question_index": self.question_index,
+            "conversation_state": self.conversation_state,
+            "answers": self.answers.to_dict() if self.answers is not None else None,
+            "checklist": self.checklist.to_dict(),
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict, answer_capacity: int = 64) -> "Session":
+        answers = data.get("answers")
+        session = cls(
+            user_id=data["user_id"],
+            mode=data.get("mode", "generic"),
+            question_index=data.get("question_index", 0),
+            conversation_state=data.get("conversation_state"),
+            answers=AnswerMatrix.from_dict(answers, answer_capacity) if answers else None,
+        )
+        if "payloads" in data:
+            session.history = [Message.from_dict(message) for message in data.get("history", [])]
+            session.payloads = PayloadStore(data["payloads"])
+        else:
+            # Saved before messages were typed: move long replies into the payload store
+            for message in map(Message.from_dict, data.get("history", [])):
+                session.add_message(message.role, message.content, message.question_index, message.compliant, message.embedding_row)
+        if "checklist" in data:
+            session.checklist = Checklist.from_dict(data["checklist"])
+        else:
+            session.checklist = Checklist.from_history(session.history, session.text)
+        return session
+
+    def dumps(self) -> bytes:
+        return json.dumps(self.to_dict(), ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+    @classmethod
+    def loads(cls, payload: bytes, answer_capacity: int = 64) -> "Session":
+        return cls.from_dict(json.loads(payload), answer_capacity)
+
+    def approx_bytes(self) -> int:
+        """Rough resident size: history records and payloads, the answer arena and the checklist."""
+        size = sys.getsizeof(self.history) + sum(message.approx_bytes() for message in self.history)
+        size += self.payloads.approx_bytes()
+        if self.answers is not None:
+            size += self.answers.nbytes()
+        size += self.checklist.approx_bytes()
+        return size
+
+
+class _KeyedLocks:
+    """asyncio locks per key, dropped again once nobody holds or waits for them."""
+
+    def __init__(self):
+        self._locks: Dict[str, List] = {}
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._locks
+
+    @asynccontextmanager
+    async def hold(self, key: str, timeout: float):
+        entry = self._locks.setdefault(key, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            try:
+                await asyncio.wait_for(entry[0].acquire(), timeout)
+            except asyncio.TimeoutError:
+                raise SessionBusy(f"Session '{key}' is busy") from None
+            try:
+                yield
+            finally:
+                entry[0].release()
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._locks[key]
+
+
+class SessionStore:
+    """Atomic get/update of whole sessions.
+
+    `async with store.session(user_id) as session:` locks the session, loads
+    it (or starts a new one), and writes it back when the block exits
+    without an exception. Within one process a per-session asyncio lock
+    serializes requests; the shared backends additionally take a lease in
+    the backend itself so requests for the same user on other workers or
+    tasks wait their turn. A lease expires after `lock_ttl` seconds so a
+    crashed worker cannot wedge a session; while the block runs (e.g. across
+    a long LLM call) the lease is renewed every `lock_ttl / 3` seconds, and
+    the session is only written back if this request still owns it.
+    """
+
+    backend = "base"
+
+    def __init__(self, lock_ttl: float = 120, lock_timeout: float = 30, answer_capacity: int = 64):
+        self.lock_ttl = lock_ttl
+        self.lock_timeout = lock_timeout
+        self.answer_capacity = answer_capacity
+        self._local_locks = _KeyedLocks()
+        self.loads = 0
+        self.saves = 0
+        self.lock_waits = 0
+        self.busy = 0
+        self.leases_lost = 0
+
+    @asynccontextmanager
+    async def session(self, user_id: str) -> AsyncIterator[Session]:
+        try:
+            async with self._local_locks.hold(user_id, self.lock_timeout):
+                token = await self._acquire(user_id)
+                renewer = asyncio.create_task(self._keep_lease(user_id, token)) if token is not None else None
+                try:
+                    session = await self._load(user_id)
+                    self.loads += 1
+                    if session is None:
+                        session = Session(user_id)
+                    yield session
+                    if not await self._save(session, token):
+                        self.leases_lost += 1
+                        raise SessionLeaseLost(f"Session '{user_id}' was taken over by another request; update discarded")
+                    self.saves += 1
+                finally:
+                    if renewer is not None:
+                        renewer.cancel()
+                    await self._release(user_id, token)
+        except SessionBusy:
+            self.busy += 1
+            raise
+
+    async def get(self, user_id: str) -> Optional[Session]:
+        """Read-only snapshot of a session without taking its lock."""
+        return await self._load(user_id)
+
+    async def _acquire(self, user_id: str) -> Optional[str]:
+        return None
+
+    async def _release(self, user_id: str, token: Optional[str]):
+        pass
+
+    async def _renew(self, user_id: str, token: str) -> bool:
+        """Push the lease's expiry `lock_ttl` seconds out; False if it is no longer ours."""
+        return True
+
+    async def _keep_lease(self, user_id: str, token: str):
+        while True:
+            await asyncio.sleep(self.lock_ttl / 3)
+            try:
+                if not await self._renew(user_id, token):
+                    logger.warning("Session lease for %s expired mid-update and was taken over", user_id)
+                    return
+            except Exception:
+                logger.exception("Renewing the session lease for %s failed", user_id)
+
+    async def _wait_for_lease(self, user_id: str, try_acquire) -> str:
+        """Poll `try_acquire(token)` until it succeeds or the wait timeout runs out."""
+        token = uuid.uuid4().hex
+        deadline = time.monotonic() + self.lock_timeout
+        delay = 0.01
+        waited = False
+        while not await try_acquire(token):
+            waited = True
+            if time.monotonic() >= deadline:
+                raise SessionBusy(f"Session '{user_id}' is locked by another worker")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 0.2)
+        if waited:
+            self.lock_waits += 1
+        return token
+
+    async def _load(self, user_id: str) -> Optional[Session]:
+        raise NotImplementedError
+
+    async def _save(self, session: Session, token: Optional[str]) -> bool:
+        """Write the session back if `token` still holds its lease; False (and no write) otherwise."""
+        raise NotImplementedError
+
+    async def sweep(self):
+        """Periodic housekeeping; backends that keep sessions resident evict here."""
+
+    async def close(self):
+        pass
+
+    def stats(self) -> Dict:
+        return {
+            "backend": self.backend,
+            "loads": self.loads,
+            "saves": self.saves,
+            "lock_waits": self.lock_waits,
+            "busy": self.busy,
+            "leases_lost": self.leases_lost,
+        }
+
+
+class MemorySessionStore(SessionStore):
+    """Sessions as live objects in this process; only safe with a single worker.
+
+    Resident sessions are kept in LRU order. A session idle for longer than
+    `idle_ttl` seconds, or the least recently used ones once there are more
+    than `max_resident` sessions or they take more than `max_resident_mb`
+    (approximately), are serialized to `spill_dir` and dropped from memory;
+    the next request for that user restores them transparently. Spilled
+    files untouched for `spill_ttl` seconds are deleted. Sessions with a
+    request in flight are never evicted.
+    """
+
+    backend = "memory"
+
+    def __init__(self, idle_ttl: float = 3600, max_resident: int = 5000, max_resident_mb: float = 512,
+                 spill_dir: str = None, spill_ttl: float = 604800, **kwargs):
+        super().__init__(**kwargs)
+        self.idle_ttl = idle_ttl
+        self.max_resident = max_resident
+        self.max_resident_bytes = int(max_resident_mb * 1024 * 1024)
+        self.spill_dir = spill_dir
+        self.spill_ttl = spill_ttl
+        if spill_dir:
+            os.makedirs(spill_dir, exist_ok=True)
+        self._sessions: "OrderedDict[str, Session]" = OrderedDict()
+        self._last_access: Dict[str, float] = {}
+        self._sizes: Dict[str, int] = {}
+        self._resident_bytes = 0
+        self._restoring: Dict[str, asyncio.Future] = {}
+        self.evictions: Dict[str, int] = {"idle": 0, "count": 0, "memory": 0}
+        self.spills = 0
+        self.restores = 0
+        self.dropped = 0
+        self.spill_errors = 0
+
+    def _spill_path(self, user_id: str) -> str:
+        # Hashed so arbitrary user ids are safe file names
+        return os.path.join(self.spill_dir, hashlib.sha256(user_id.encode("utf-8")).hexdigest() + ".json")
+
+    async def _load(self, user_id: str) -> Optional[Session]:
+        # A session being spilled stays resident until its file is complete
+        session = self._sessions.get(user_id)
+        if session is not None:
+            self._sessions.move_to_end(user_id)
+            self._last_access[user_id] = time.time()
+            return session
+        if not self.spill_dir:
+            return None
+        # get() and a locked request may both miss; let them share one restore
+        # rather than the second finding the file already gone
+        restore = self._restoring.get(user_id)
+        if restore is None:
+            restore = self._restoring[user_id] = asyncio.ensure_future(self._restore(user_id))
+            restore.add_done_callback(lambda _: self._restoring.pop(user_id, None))
+        return await asyncio.shield(restore)
+
+    async def _restore(self, user_id: str) -> Optional[Session]:
+        try:
+            payload = await asyncio.to_thread(self._read_spill, self._spill_path(user_id))
+        except FileNotFoundError:
+            return None
+        session = Session.loads(payload, self.answer_capacity)
+        self.restores += 1
+        self._remember(session)
+        return session
+
+    @staticmethod
+    def _read_spill(path: str) -> bytes:
+        with open(path, "rb") as f:
+            payload = f.read()
+        os.remove(path)
+        return payload
+
+    @staticmethod
+    def _write_spill(path: str, payload: bytes):
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(payload)
+        os.replace(tmp_path, path)
+
+    def _remember(self, session: Session):
+        user_id = session.user_id
+        size = session.approx_bytes()
+        self._resident_bytes += size - self._sizes.get(user_id, 0)
+        self._sizes[user_id] = size
+        self._sessions[user_id] = session
+        self._sessions.move_to_end(user_id)
+        self._last_access[user_id] = time.time()
+
+    def _forget(self, user_id: str) -> Optional[Session]:
+        session = self._sessions.pop(user_id, None)
+        self._last_access.pop(user_id, None)
+        self._resident_bytes -= self._sizes.pop(user_id, 0)
+        return session
+
+    async def _save(self, session: Session, token: Optional[str]) -> bool:
+        self._remember(session)
+        # Caps are enforced on every write; idle sessions are swept periodically
+        await self._evict(include_idle=False)
+        return True
+
+    async def _evict(self, include_idle: bool):
+        now = time.time()
+        victims = []
+        resident, resident_bytes = len(self._sessions), self._resident_bytes
+        # Oldest access first, so the scan stops at the first session worth keeping
+        for user_id in self._sessions:
+            if user_id in self._local_locks:
+                continue
+            if include_idle and now - self._last_access[user_id] > self.idle_ttl:
+                reason = "idle"
+            elif resident > self.max_resident:
+                reason = "count"
+            elif resident_bytes > self.max_resident_bytes:
+                reason = "memory"
+            else:
+                break
+            victims.append((user_id, reason))
+            resident -= 1
+            resident_bytes -= self._sizes[user_id]
+        for user_id, reason in victims:
+            await self._spill(user_id, reason)
+
+    async def _spill(self, user_id: str, reason: str):
+        if user_id in self._local_locks or user_id not in self._sessions:
+            return
+        # Hold the user's lock for the whole spill, so a request for them waits
+        # until the file is written; the session is only dropped from memory after that
+        async with self._local_locks.hold(user_id, self.lock_timeout):
+            session = self._sessions.get(user_id)
+            if session is None:
+                return
+            if self.spill_dir:
+                try:
+                    await asyncio.to_thread(self._write_spill, self._spill_path(user_id), session.dumps())
+                except OSError:
+                    self.spill_errors += 1
+                    logger.exception("Could not spill session %s to disk; keeping it in memory", user_id)
+                    return
+                self.spills += 1
+            else:
+                self.dropped += 1
+            self._forget(user_id)
+            self.evictions[reason] += 1
+
+    async def sweep(self):
+        await self._evict(include_idle=True)
+        if self.spill_dir and self.spill_ttl:
+            await asyncio.to_thread(self._expire_spills, time.time() - self.spill_ttl)
+
+    def _expire_spills(self, cutoff: float):
+        for entry in os.scandir(self.spill_dir):
+            if entry.name.endswith(".json") and entry.stat().st_mtime < cutoff:
+                os.remove(entry.path)
+
+    def stats(self) -> Dict:
+        # Arena bytes vs. what the same embeddings cost as per-message float lists
+        arenas = [session.answers for session in self._sessions.values() if session.answers is not None]
+        arena_bytes = sum(arena.nbytes() for arena in arenas)
+        list_bytes = sum(arena.list_equivalent_bytes() for arena in arenas)
+        spilled = sum(1 for name in os.listdir(self.spill_dir) if name.endswith(".json")) if self.spill_dir else 0
+        return dict(
+            super().stats(),
+            sessions=len(self._sessions),
+            resident_bytes=self._resident_bytes,
+            spilled_sessions=spilled,
+            evictions=dict(self.evictions),
+            spills=self.spills,
+            restores=self.restores,
+            dropped=self.dropped,
+            spill_errors=self.spill_errors,
+            policy_sessions=len(arenas),
+            answer_embeddings=sum(len(arena) for arena in arenas),
+            embedding_bytes=arena_bytes,
+            embedding_bytes_per_session=round(arena_bytes / len(arenas)) if arenas else 0,
+            list_equivalent_bytes_per_session=round(list_bytes / len(arenas)) if arenas else 0,
+        )
+
+
+class SQLiteSessionStore(SessionStore):
+    """Sessions as JSON rows in a SQLite database in WAL mode.
+
+    Several worker processes on one host can share the file; a lease row per
+    session stands in for a cross-process lock. Queries run in a worker
+    thread so they never block the event loop.
+    """
+
+    backend = "sqlite"
+
+    def __init__(self, path: str, **kwargs):
+        super().__init__(**kwargs)
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._db_lock = threading.Lock()
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            "user_id TEXT PRIMARY KEY, data BLOB NOT NULL, updated_at REAL NOT NULL)"
+        )
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS session_leases ("
+            "user_id TEXT PRIMARY KEY, owner TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+
+    async def _execute(self, sql: str, params: tuple = ()):
+        def run():
+            with self._db_lock:
+                cursor = self._db.execute(sql, params)
+                return cursor.rowcount, cursor.fetchall()
+        return await asyncio.to_thread(run)
+
+    async def _acquire(self, user_id: str) -> str:
+        async def try_acquire(token: str) -> bool:
+            now = time.time()
+            changed, _ = await self._execute(
+                "INSERT INTO session_leases (user_id, owner, expires_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(user_id) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at "
+                "WHERE session_leases.expires_at < ?",
+                (user_id, token, now + self.lock_ttl, now),
+            )
+            return changed == 1
+        return await self._wait_for_lease(user_id, try_acquire)
+
+    async def _release(self, user_id: str, token: str):
+        await self._execute("DELETE FROM session_leases WHERE user_id = ? AND owner = ?", (user_id, token))
+
+    async def _load(self, user_id: str) -> Optional[Session]:
+        _, rows = await self._execute("SELECT data FROM sessions WHERE user_id = ?", (user_id,))
+        return Session.loads(rows[0][0], self.answer_capacity) if rows else None
+
+    async def _renew(self, user_id: str, token: str) -> bool:
+        changed, _ = await self._execute(
+            "UPDATE session_leases SET expires_at = ? WHERE user_id = ? AND owner = ?",
+            (time.time() + self.lock_ttl, user_id, token),
+        )
+        return changed == 1
+
+    async def _save(self, session: Session, token: str) -> bool:
+        # Write and ownership check in one statement; an expired lease nobody took over still counts
+        changed, _ = await self._execute(
+            "INSERT OR REPLACE INTO sessions (user_id, data, updated_at) SELECT ?, ?, ? "
+            "WHERE EXISTS (SELECT 1 FROM session_leases WHERE user_id = ? AND owner = ?)",
+            (session.user_id, session.dumps(), time.time(), session.user_id, token),
+        )
+        return changed == 1
+
+    async def close(self):
+        with self._db_lock:
+            self._db.close()
+
+
+class RedisSessionStore(SessionStore):
+    """Sessions as JSON values in any server speaking the Redis protocol.
+
+    Lets workers on different hosts/tasks share sessions. The lock is a
+    `SET NX PX` key holding a random token, released with WATCH/MULTI so it
+    only works on servers (or local stand-ins) that implement transactions,
+    but needs no Lua scripting.
+    """
+
+    backend = "redis"
+
+    def __init__(self, url: str, key_prefix: str = "matra:session:", **kwargs):
+        super().__init__(**kwargs)
+        import redis.asyncio as redis
+
+        self.url = url
+        self.key_prefix = key_prefix
+        self._redis = redis.from_url(url)
+        self._watch_error = redis.WatchError
+
+    def _key(self, user_id: str) -> str:
+        return f"{self.key_prefix}{user_id}"
+
+    async def _acquire(self, user_id: str) -> str:
+        lock_key = f"{self._key(user_id)}:lock"
+
+        async def try_acquire(token: str) -> bool:
+            return bool(await self._redis.set(lock_key, token, nx=True, px=int(self.lock_ttl * 1000)))
+        return await self._wait_for_lease(user_id, try_acquire)
+
+    async def _release(self, user_id: str, token: str):
+        lock_key = f"{self._key(user_id)}:lock"
+        async with self._redis.pipeline(transaction=True) as pipe:
+            try:
+                await pipe.watch(lock_key)
+                owner = await pipe.get(lock_key)
+                if owner is not None and owner.decode() == token:
+                    pipe.multi()
+                    pipe.delete(lock_key)
+                    await pipe.execute()
+                else:
+                    await pipe.unwatch()
+            except self._watch_error:
+                # The lease expired and someone else took it meanwhile; leave theirs alone
+                logger.warning("Session lock for %s changed hands before release", user_id)
+
+    async def _load(self, user_id: str) -> Optional[Session]:
+        payload = await self._redis.get(self._key(user_id))
+        return Session.loads(payload, self.answer_capacity) if payload is not None else None
+
+    async def _if_owner(self, user_id: str, token: str, command) -> bool:
+        """Run `command(pipe)` in a transaction only if `token` still holds the lock key."""
+        lock_key = f"{self._key(user_id)}:lock"
+        async with self._redis.pipeline(transaction=True) as pipe:
+            try:
+                await pipe.watch(lock_key)
+                owner = await pipe.get(lock_key)
+                if owner is None or owner.decode() != token:
+                    await pipe.unwatch()
+                    return False
+                pipe.multi()
+                command(pipe)
+                await pipe.execute()
+                return True
+            except self._watch_error:
+                return False
+
+    async def _renew(self, user_id: str, token: str) -> bool:
+        lock_key = f"{self._key(user_id)}:lock"
+        return await self._if_owner(user_id, token, lambda pipe: pipe.pexpire(lock_key, int(self.lock_ttl * 1000)))
+
+    async def _save(self, session: Session, token: str) -> bool:
+        payload = session.dumps()
+        return await self._if_owner(session.user_id, token, lambda pipe: pipe.set(self._key(session.user_id), payload))
+
+    async def close(self):
+        await self._redis.aclose()
+
+
+def create_session_store(backend: str, sqlite_path: str = None, redis_url: str = None,
+                         key_prefix: str = "matra:session:", memory_limits: Dict = None, **kwargs) -> SessionStore:
+    """Build the configured store; `memory_limits` (TTL, caps, spill dir) only apply to "memory"."""
+    if backend == "memory":
+        return MemorySessionStore(**(memory_limits or {}), **kwargs)
+    if backend == "sqlite":
+        return SQLiteSessionStore(sqlite_path, **kwargs)
+    if backend == "redis":
+        return RedisSessionStore(redis_url, key_prefix=key_prefix, **kwargs)
+    raise ValueError(f"Unknown session backend '{backend}'; expected one of {SESSION_BACKENDS}")
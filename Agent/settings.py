@@ -68,6 +68,95 @@ QUERY_AGENT_MODEL = MODELS.get("QUERY_AGENT_MODEL")
 POLICY_GENERATOR_MODEL = MODELS.get("POLICY_GENERATOR_MODEL")
 VALIDATOR_AGENT_MODEL = MODELS.get("VALIDATOR_AGENT_MODEL") # Changed default
 EMBEDDING_MODEL_NAME = MODELS.get("embedding_model_name")
+EMBEDDING_BACKEND = MODELS.get("embedding_backend", "torch")
+EMBEDDING_ONNX_INT8_FILE = MODELS.get("embedding_onnx_int8_file", "onnx/model_quint8_avx2.onnx")
+
+# --- Embedding Service ---
+EMBEDDING = config.get('embedding', {})
+EMBEDDING_CACHE_SIZE = EMBEDDING.get("cache_size", 4096)
+EMBEDDING_BATCH_SIZE = EMBEDDING.get("batch_size", 32)
+EMBEDDING_MICRO_BATCH_MAX_SIZE = EMBEDDING.get("micro_batch_max_size", 16)
+EMBEDDING_MICRO_BATCH_MAX_WAIT_MS = EMBEDDING.get("micro_batch_max_wait_ms", 5)
+
+# --- LLM Gateway ---
+LLM_GATEWAY = config.get('llm_gateway', {})
+LLM_DEFAULT_MAX_CONCURRENCY = LLM_GATEWAY.get("default_max_concurrency", 8)
+LLM_DEFAULT_TIMEOUT = LLM_GATEWAY.get("default_timeout", 60)
+# Resolve role names (GENERIC_MODEL, ...) to the configured model ids
+LLM_MODEL_LIMITS = {
+    MODELS[role]: limits
+    for role, limits in (LLM_GATEWAY.get("limits") or {}).items()
+    if MODELS.get(role)
+}
+
+# --- Output Pacing ---
+PACING = config.get('pacing', {})
+PACING_MODE = PACING.get("mode", "time_budget")
+PACING_CHUNK_UNIT = PACING.get("chunk_unit", "tokens")
+PACING_CHUNK_SIZE = PACING.get("chunk_size", 5)
+PACING_INTERVAL_MS = PACING.get("interval_ms", 50)
+PACING_MAX_DURATION_MS = PACING.get("max_duration_ms", 1500)
+
+# --- Policy Generation ---
+POLICY_GENERATION = config.get('policy_generation', {})
+POLICY_GENERATION_MODE = POLICY_GENERATION.get("mode", "stream")
+POLICY_FLUSH_INTERVAL_MS = POLICY_GENERATION.get("flush_interval_ms", 250)
+POLICY_TEMPLATE_RELOAD_INTERVAL_SECONDS = POLICY_GENERATION.get("template_reload_interval_seconds", 5)
+POLICY_MAX_PARALLEL_SECTIONS = POLICY_GENERATION.get("max_parallel_sections", 4)
+
+# --- Validation Cache ---
+VALIDATION_CACHE = config.get('validation_cache', {})
+VALIDATION_CACHE_ENABLED = VALIDATION_CACHE.get("enabled", True)
+VALIDATION_CACHE_BACKEND = VALIDATION_CACHE.get("backend", "memory")
+VALIDATION_CACHE_MAX_ENTRIES = VALIDATION_CACHE.get("max_entries", 5000)
+VALIDATION_CACHE_TTL_SECONDS = VALIDATION_CACHE.get("ttl_seconds", 604800)
+
+# --- Semantic Cache ---
+SEMANTIC_CACHE = config.get('semantic_cache', {})
+SEMANTIC_CACHE_ENABLED = SEMANTIC_CACHE.get("enabled", True)
+SEMANTIC_CACHE_THRESHOLD = SEMANTIC_CACHE.get("similarity_threshold", 0.95)
+SEMANTIC_CACHE_MAX_ENTRIES = SEMANTIC_CACHE.get("max_entries", 1024)
+
+# --- Document Render Pool ---
+RENDER_POOL = config.get('render_pool', {})
+RENDER_POOL_MAX_WORKERS = RENDER_POOL.get("max_workers", 2)
+RENDER_POOL_MAX_QUEUE = RENDER_POOL.get("max_queue", 8)
+RENDER_POOL_RETRY_AFTER_SECONDS = RENDER_POOL.get("retry_after_seconds", 10)
+
+# --- Retrieval ---
+RETRIEVAL = config.get('retrieval', {})
+RETRIEVAL_BACKEND = RETRIEVAL.get("backend", "chroma")
+RETRIEVAL_K = RETRIEVAL.get("k", 4)
+
+# --- Sessions ---
+SESSIONS = config.get('sessions', {})
+SESSION_EMBEDDING_DTYPE = SESSIONS.get("embedding_dtype", "float32")
+SESSION_BACKEND = SESSIONS.get("backend", "memory")
+SESSION_REDIS_URL = os.getenv("REDIS_URL", SESSIONS.get("redis_url", "redis://localhost:6379/0"))
+SESSION_KEY_PREFIX = SESSIONS.get("key_prefix", "matra:session:")
+SESSION_LOCK_TTL_SECONDS = SESSIONS.get("lock_ttl_seconds", 240)
+SESSION_LOCK_TIMEOUT_SECONDS = SESSIONS.get("lock_timeout_seconds", 30)
+SESSION_IDLE_TTL_SECONDS = SESSIONS.get("idle_ttl_seconds", 3600)
+SESSION_MAX_RESIDENT = SESSIONS.get("max_resident", 5000)
+SESSION_MAX_RESIDENT_MB = SESSIONS.get("max_resident_mb", 512)
+SESSION_SPILL_TTL_SECONDS = SESSIONS.get("spill_ttl_seconds", 604800)
+SESSION_SWEEP_INTERVAL_SECONDS = SESSIONS.get("sweep_interval_seconds", 60)
+SESSION_MAX_GENERIC_TURNS = SESSIONS.get("max_generic_turns", 20)
+# A lease must outlive the slowest single LLM call even before its first renewal
+_LLM_MAX_TIMEOUT = max([LLM_DEFAULT_TIMEOUT] + [limits.get("timeout", LLM_DEFAULT_TIMEOUT) for limits in LLM_MODEL_LIMITS.values()])
+if SESSION_LOCK_TTL_SECONDS <= _LLM_MAX_TIMEOUT:
+    raise ValueError(
+        f"sessions.lock_ttl_seconds ({SESSION_LOCK_TTL_SECONDS}) must be longer than the longest "
+        f"llm_gateway timeout ({_LLM_MAX_TIMEOUT}s)"
+    )
+
+# --- Pre-fork Server ---
+SERVER = config.get('server', {})
+SERVER_HOST = SERVER.get("host", "0.0.0.0")
+SERVER_PORT = SERVER.get("port", 8088)
+SERVER_WORKERS = SERVER.get("workers", 1)
+SERVER_THREADS_PER_WORKER = SERVER.get("threads_per_worker", 1)
+SERVER_MEMORY_REPORT_INTERVAL_SECONDS = SERVER.get("memory_report_interval_seconds", 300)
 
 # --- Collection Names ---
 COLLECTIONS = config.get('collections', {})
@@ -79,9 +168,15 @@ PATHS = config.get('paths', {})
 # Construct absolute paths based on the project root (assuming config.py is in a subdirectory like 'src')
 PROJECT_ROOT = os.path.abspath(".")
 CHROMA_DB_PATH = os.path.join(PROJECT_ROOT, PATHS.get("chroma_db_path"))
+# Content-hash manifest of both collections, kept next to them
+INDEX_MANIFEST_PATH = os.path.join(CHROMA_DB_PATH, "index_manifest.json")
+INDEX_SNAPSHOT_PATH = os.path.join(PROJECT_ROOT, PATHS.get("index_snapshot_path", "index_snapshot"))
 POLICY_JSON_FILE = os.path.join(PROJECT_ROOT, PATHS.get("policy_json_file"))
 GENERIC_JSON_FILE = os.path.join(PROJECT_ROOT, PATHS.get("generic_json_file"))
 TEMPLATE_FILE = os.path.join(PROJECT_ROOT, PATHS.get("template_file"))
+VALIDATION_CACHE_PATH = os.path.join(PROJECT_ROOT, VALIDATION_CACHE.get("sqlite_path", "cache/validation_cache.sqlite3"))
+SESSION_SQLITE_PATH = os.path.join(PROJECT_ROOT, SESSIONS.get("sqlite_path", "cache/sessions.sqlite3"))
+SESSION_SPILL_DIR = os.path.join(PROJECT_ROOT, SESSIONS.get("spill_dir", "cache/sessions"))
 
 # --- System Prompts ---
 SYSTEM_PROMPTS = config.get('system_prompts', {})
@@ -89,9 +184,9 @@ GENERIC_SYSTEM_PROMPT = SYSTEM_PROMPTS.get("GENERIC_SYSTEM_PROMPT")
 POLICY_SYSTEM_PROMPT = SYSTEM_PROMPTS.get("POLICY_SYSTEM_PROMPT")
 VALIDATOR_SYSTEM_PROMPT = SYSTEM_PROMPTS.get("VALIDATOR_SYSTEM_PROMPT")
 
-# # --- Logging ---
-# LOGGING_CONFIG = config.get('logging', {})
-# LOG_LEVEL = LOGGING_CONFIG.get('level', 'INFO').upper()
+# --- Logging ---
+LOGGING_CONFIG = config.get('logging', {})
+LOG_LEVEL = LOGGING_CONFIG.get('level', 'INFO').upper()
 # LOG_FILE = LOGGING_CONFIG.get('file', 'app.log')
 # # Construct absolute path for log file
 # LOG_FILE_PATH = os.path.join(PROJECT_ROOT, LOG_FILE)
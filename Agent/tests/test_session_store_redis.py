@@ -0,0 +1,91 @@
+"""RedisSessionStore leases against fakeredis (pip install fakeredis pytest)."""
+import asyncio
+
+import pytest
+
+fakeredis = pytest.importorskip("fakeredis")
+
+from session_store import RedisSessionStore, SessionBusy, SessionLeaseLost
+
+
+def make_store(server, **kwargs) -> RedisSessionStore:
+    store = RedisSessionStore("redis://localhost:6379/0", key_prefix="test:", **kwargs)
+    store._redis = fakeredis.FakeAsyncRedis(server=server)
+    return store
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_session_is_saved_and_lock_released():
+    async def scenario():
+        server = fakeredis.FakeServer()
+        store = make_store(server)
+        async with store.session("u1") as session:
+            assert await store._redis.get("test:u1:lock") is not None
+            session.add_message("user", "hello")
+        assert await store._redis.get("test:u1:lock") is None
+        saved = await store.get("u1")
+        assert [message.content for message in saved.history] == ["hello"]
+        assert store.stats()["saves"] == 1
+
+    run(scenario())
+
+
+def test_contention_raises_session_busy():
+    async def scenario():
+        server = fakeredis.FakeServer()
+        holder = make_store(server)
+        waiter = make_store(server, lock_timeout=0.1)
+        async with holder.session("u1"):
+            with pytest.raises(SessionBusy):
+                async with waiter.session("u1"):
+                    pass
+        assert waiter.stats()["busy"] == 1
+        # Once the holder is done the lease is free again
+        async with waiter.session("u1"):
+            pass
+
+    run(scenario())
+
+
+def test_lease_is_renewed_while_the_update_runs():
+    async def scenario():
+        server = fakeredis.FakeServer()
+        store = make_store(server, lock_ttl=0.3)
+        contender = make_store(server, lock_timeout=0.05)
+        async with store.session("u1") as session:
+            # Three times the TTL: only renewal keeps the lease alive
+            await asyncio.sleep(0.9)
+            with pytest.raises(SessionBusy):
+                async with contender.session("u1"):
+                    pass
+            session.add_message("user", "slow update")
+        assert store.stats()["leases_lost"] == 0
+        saved = await store.get("u1")
+        assert [message.content for message in saved.history] == ["slow update"]
+
+    run(scenario())
+
+
+def test_save_is_refused_after_the_lease_is_lost():
+    async def scenario():
+        server = fakeredis.FakeServer()
+        store = make_store(server)
+        other = make_store(server)
+        async with other.session("u1") as session:
+            session.add_message("user", "first")
+        with pytest.raises(SessionLeaseLost):
+            async with store.session("u1") as session:
+                session.add_message("user", "stale")
+                # The lease expires and another worker takes the session over
+                await store._redis.delete("test:u1:lock")
+                await store._redis.set("test:u1:lock", "someone-else")
+        assert store.stats()["leases_lost"] == 1
+        # The stale update was discarded and the other worker's lock left alone
+        saved = await store.get("u1")
+        assert [message.content for message in saved.history] == ["first"]
+        assert await store._redis.get("test:u1:lock") == b"someone-else"
+
+    run(scenario())
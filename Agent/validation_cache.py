@@ -0,0 +1,171 @@
+import asyncio
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Dict, Optional
+
+
+def normalize_answer(answer: str) -> str:
+    """NFC-normalize and collapse whitespace so trivially re-pasted answers match."""
+    return " ".join(unicodedata.normalize("NFC", answer).split())
+
+
+def _sha256(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class ValidationCache:
+    """LRU + TTL cache of validator verdicts with an optional SQLite backend.
+
+    The in-memory LRU is always consulted first. With backend="sqlite" every
+    verdict is also written to disk, so a restarted worker starts warm; disk
+    hits are promoted back into memory. Disk reads and writes run in a worker
+    thread, and the table is trimmed back to `max_entries` every
+    `max_entries // 10` inserts rather than on each one.
+    """
+
+    def __init__(self, max_entries: int = 5000, ttl_seconds: float = 604800, backend: str = "memory",
+                 sqlite_path: str = None, enabled: bool = True):
+        if backend not in ("memory", "sqlite"):
+            raise ValueError(f"Unknown validation cache backend '{backend}'; expected 'memory' or 'sqlite'")
+        self.enabled = enabled
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.backend = backend
+        self._memory: "OrderedDict[str, tuple]" = OrderedDict()
+        self._db = None
+        self._db_lock = threading.Lock()
+        # The disk table may overshoot max_entries by this many rows between trims
+        self._trim_interval = max(1, max_entries // 10)
+        self._inserts_since_trim = 0
+        self.disk_trims = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evictions = 0
+        if enabled and backend == "sqlite":
+            self._open_db(sqlite_path)
+
+    def _open_db(self, path: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS validation_cache ("
+            "key TEXT PRIMARY KEY, compliance TEXT NOT NULL, message TEXT NOT NULL, "
+            "created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS validation_cache_accessed ON validation_cache (accessed_at)")
+        # Catch up on a table left over the limit, e.g. by a smaller max_entries
+        self._trim()
+
+    @staticmethod
+    def make_key(question_index: int, validator: str, answer: str, model: str = "", system_prompt: str = "") -> str:
+        """Key = question index + hash of the validator setup + hash of the normalized answer.
+
+        The model and system prompt are folded into the validator hash so a
+        config change never serves verdicts from a different validator.
+        """
+        validator_hash = _sha256(f"{model}\n{system_prompt}\n{validator}")
+        answer_hash = _sha256(normalize_answer(answer))
+        return f"{question_index}:{validator_hash}:{answer_hash}"
+
+    async def get(self, key: str) -> Optional[Dict]:
+        if not self.enabled:
+            return None
+        now = time.time()
+        entry = self._memory.get(key)
+        if entry is not None:
+            created_at, result = entry
+            if now - created_at <= self.ttl_seconds:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return dict(result)
+            del self._memory[key]
+            self.expired += 1
+        if self._db is not None:
+            # SQLite work runs in a thread so the event loop never waits on disk
+            row, expired = await asyncio.to_thread(self._disk_get, key, now)
+            if row is not None:
+                created_at, result = row
+                self._remember(key, created_at, result)
+                self.disk_hits += 1
+                return dict(result)
+            self.expired += expired
+        self.misses += 1
+        return None
+
+    def _disk_get(self, key: str, now: float):
+        with self._db_lock:
+            row = self._db.execute(
+                "SELECT compliance, message, created_at FROM validation_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None, 0
+            compliance, message, created_at = row
+            if now - created_at > self.ttl_seconds:
+                self._db.execute("DELETE FROM validation_cache WHERE key = ?", (key,))
+                return None, 1
+            self._db.execute("UPDATE validation_cache SET accessed_at = ? WHERE key = ?", (now, key))
+            return (created_at, {"compliance": compliance, "message": message}), 0
+
+    async def set(self, key: str, result: Dict):
+        if not self.enabled:
+            return
+        now = time.time()
+        result = {"compliance": result["compliance"], "message": result["message"]}
+        self._remember(key, now, result)
+        if self._db is not None:
+            await asyncio.to_thread(self._disk_set, key, result, now)
+
+    def _disk_set(self, key: str, result: Dict, now: float):
+        with self._db_lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO validation_cache (key, compliance, message, created_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, result["compliance"], result["message"], now, now),
+            )
+            self._inserts_since_trim += 1
+            if self._inserts_since_trim >= self._trim_interval:
+                self._trim()
+
+    def _trim(self):
+        """Drop the least recently used rows beyond the size limit, if there are any."""
+        self._inserts_since_trim = 0
+        (rows,) = self._db.execute("SELECT COUNT(*) FROM validation_cache").fetchone()
+        if rows <= self.max_entries:
+            return
+        # Oldest rows go first; accessed_at is indexed, so this only walks the excess
+        self._db.execute(
+            "DELETE FROM validation_cache WHERE key IN ("
+            "SELECT key FROM validation_cache ORDER BY accessed_at ASC LIMIT ?)",
+            (rows - self.max_entries,),
+        )
+        self.disk_trims += 1
+
+    def _remember(self, key: str, created_at: float, result: Dict):
+        self._memory[key] = (created_at, result)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.disk_hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "backend": self.backend,
+            "entries": len(self._memory),
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "expired": self.expired,
+            "evictions": self.evictions,
+            "disk_trims": self.disk_trims,
+            "hit_rate": round((self.hits + self.disk_hits) / lookups, 4) if lookups else 0.0,
+        }
@@ -0,0 +1,59 @@
+import asyncio
+import logging
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class Warmup:
+    """Runs the startup pipeline stage by stage and records how long each took.
+
+    Stages are blocking callables run in a worker thread, so the event loop
+    keeps answering /health and /ready while models load. `state` moves from
+    "starting" to "ready", or to "failed" with the failing stage and error.
+    """
+
+    def __init__(self, stages: List[Tuple[str, Callable[[], None]]]):
+        self.stages = stages
+        self.state = "starting"
+        self.current_stage: Optional[str] = None
+        self.failed_stage: Optional[str] = None
+        self.error: Optional[str] = None
+        self.timings: Dict[str, float] = {}
+        self.started_at = time.monotonic()
+        self.total_seconds: Optional[float] = None
+
+    @property
+    def ready(self) -> bool:
+        return self.state == "ready"
+
+    async def run(self):
+        self.started_at = time.monotonic()
+        for name, stage in self.stages:
+            self.current_stage = name
+            start = time.perf_counter()
+            try:
+                await asyncio.to_thread(stage)
+            except Exception as e:
+                self.state = "failed"
+                self.failed_stage = name
+                self.error = f"{type(e).__name__}: {e}"
+                logger.exception("Warmup stage '%s' failed", name)
+                return
+            self.timings[name] = round((time.perf_counter() - start) * 1000, 1)
+            logger.info("Warmup stage '%s' done in %.0f ms", name, self.timings[name])
+        self.current_stage = None
+        self.total_seconds = round(time.monotonic() - self.started_at, 3)
+        self.state = "ready"
+        logger.info("Warmup complete in %.2fs: %s", self.total_seconds, self.timings)
+
+    def status(self) -> Dict:
+        return {
+            "state": self.state,
+            "stage": self.current_stage,
+            "failed_stage": self.failed_stage,
+            "error": self.error,
+            "stage_ms": dict(self.timings),
+            "elapsed_s": self.total_seconds if self.total_seconds is not None else round(time.monotonic() - self.started_at, 3),
+        }